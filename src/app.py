@@ -1,8 +1,10 @@
 import streamlit as st
 import os
 import argparse
+import threading
 from collections import deque
 import glob
+from chat_history import ChatHistory
 from embedding_manager import EmbeddingManager
 from rag_implementations import RAG
 from llm_implementations import AnthropicLLM, GeminiLLM, DeepseekLLM
@@ -10,13 +12,18 @@ from llm_implementations import AnthropicLLM, GeminiLLM, DeepseekLLM
 # Parse command-line arguments
 parser = argparse.ArgumentParser(description="RAG Chat Interface")
 parser.add_argument("--history_depth", type=int, default=2, help="Number of past interactions to include in chat history")
+parser.add_argument("--max_history_tokens", type=int, default=4000, help="Approximate token budget for the chat history sent to the LLM")
+parser.add_argument("--workers", type=int, default=1, help="Number of worker processes used to embed uploaded files")
 args = parser.parse_args()
 
+# Maximum number of chat messages kept (and re-rendered on every rerun) per session
+MAX_DISPLAYED_MESSAGES = 200
+
 # Initialize session state for chat history and settings
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = deque(maxlen=MAX_DISPLAYED_MESSAGES)
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = deque(maxlen=args.history_depth)
+    st.session_state.chat_history = ChatHistory(args.history_depth)
 if "llm_provider" not in st.session_state:
     st.session_state.llm_provider = "anthropic"
 if "selected_topics" not in st.session_state:
@@ -24,41 +31,45 @@ if "selected_topics" not in st.session_state:
 if "results_per_topic" not in st.session_state:
     st.session_state.results_per_topic = 2
 
+# LLM implementations by provider name; only the selected one is ever constructed
+LLM_PROVIDERS = {
+    "anthropic": AnthropicLLM,
+    "gemini": GeminiLLM,
+    "deepseek": DeepseekLLM
+}
+
 # Initialize managers
 @st.cache_resource
-def init_managers():
-    embedding_manager = EmbeddingManager()
-    anthropic_llm = AnthropicLLM()
-    gemini_llm = GeminiLLM()
-    deepseek_llm = DeepseekLLM()
-    
-    # Create RAG instances with query preprocessing enabled
-    anthropic_rag = RAG(
-        llm=anthropic_llm, 
-        embedding_manager=embedding_manager.chroma_manager,
-        use_query_preprocessing=True
-    )
-    gemini_rag = RAG(
-        llm=gemini_llm, 
-        embedding_manager=embedding_manager.chroma_manager,
-        use_query_preprocessing=True
-    )
-    deepseek_rag = RAG(
-        llm=deepseek_llm, 
-        embedding_manager=embedding_manager.chroma_manager,
-        use_query_preprocessing=True
+def init_embedding_manager():
+    embedding_manager = EmbeddingManager(workers=args.workers)
+    # Load the embedding model in the background so the first page paint doesn't wait for it
+    threading.Thread(
+        target=embedding_manager.chroma_manager.embed,
+        args=(["warm up"],),
+        daemon=True
+    ).start()
+    return embedding_manager
+
+@st.cache_resource
+def get_rag(provider: str) -> RAG:
+    """Create the RAG instance for an LLM provider on first use."""
+    # Create RAG instances with query preprocessing and response caching enabled
+    return RAG(
+        llm=LLM_PROVIDERS[provider](),
+        embedding_manager=init_embedding_manager().chroma_manager,
+        use_query_preprocessing=True,
+        use_response_cache=True
     )
-    
-    return embedding_manager, anthropic_rag, gemini_rag, deepseek_rag
 
+@st.cache_data(ttl=60, show_spinner=False)
 def get_topic_directories():
     """Get a list of topic directories inside Docs folder"""
-    topic_dirs = []
-    if os.path.exists("Docs"):
-        for item in os.listdir("Docs"):
-            if os.path.isdir(os.path.join("Docs", item)):
-                topic_dirs.append(item)
-    return topic_dirs
+    # DirEntry.is_dir() reuses the type info from the directory listing
+    try:
+        with os.scandir("Docs") as entries:
+            return [entry.name for entry in entries if entry.is_dir()]
+    except FileNotFoundError:
+        return []
 
 def main():
     st.set_page_config(page_title="Cyprus University of Technology RAG", layout="wide")
@@ -72,7 +83,7 @@ def main():
     """)
     
     # Initialize managers
-    embedding_manager, anthropic_rag, gemini_rag, deepseek_rag = init_managers()
+    embedding_manager = init_embedding_manager()
     
     # Sidebar for settings and file upload
     with st.sidebar:
@@ -131,27 +142,20 @@ def main():
                     help="The topic/collection where this document will be stored"
                 )
 
-            # Save uploaded file temporarily
-            file_path = f"temp_{uploaded_file.name}"
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getvalue())
-            
-            # Process the file
+            # Process the uploaded bytes directly, without a temporary file
             try:
                 collection_name = None if topic_for_upload == "Default" else topic_for_upload
-                doc_ids = embedding_manager.add_file(
-                    file_path, 
+                doc_ids = embedding_manager.add_bytes(
+                    uploaded_file.getvalue(),
+                    uploaded_file.name,
                     metadata={'source': uploaded_file.name},
                     collection_name=collection_name
                 )
+                get_topic_directories.clear()
                 st.success(f"Successfully processed {uploaded_file.name}")
                 st.info(f"Added {len(doc_ids)} chunks to {'the default collection' if collection_name is None else f'the {collection_name} collection'}")
             except Exception as e:
                 st.error(f"Error processing file: {str(e)}")
-            finally:
-                # Clean up temporary file
-                if os.path.exists(file_path):
-                    os.remove(file_path)
     
     # Main chat interface
     st.header("Chat Interface")
@@ -172,15 +176,10 @@ def main():
         
         # Get AI response
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                # Use selected RAG implementation
-                if st.session_state.llm_provider == "anthropic":
-                    rag = anthropic_rag
-                elif st.session_state.llm_provider == "gemini":
-                    rag = gemini_rag
-                else:
-                    rag = deepseek_rag
-                    
+            try:
+                # Use selected RAG implementation, created on first use
+                rag = get_rag(st.session_state.llm_provider)
+                
                 # Configure RAG with selected topics
                 if st.session_state.selected_topics:
                     rag.set_selected_topics(
@@ -190,38 +189,40 @@ def main():
                 else:
                     # Reset to default if no topics selected
                     rag.set_selected_topics([])
-                    
-                try:
-                    # Format history if available
-                    history_text = ""
-                    if len(st.session_state.chat_history) > 0:
-                        history_text = "Chat History:\n"
-                        for i, (past_question, past_response) in enumerate(st.session_state.chat_history):
-                            history_text += f"User: {past_question}\nAssistant: {past_response}\n\n"
-                    
-                    # Query with history included and pass chat_history for query preprocessing
-                    response = rag.query(
-                        prompt, 
-                        system_prompt=None, 
-                        history=history_text,
-                        chat_history=list(st.session_state.chat_history) if st.session_state.chat_history else None
-                    )
-                    st.markdown(response)
-                    
-                    # Add assistant response to chat history
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                    
-                    # Add to concise history queue (only question/answer pairs)
-                    st.session_state.chat_history.append((prompt, response))
-                except Exception as e:
-                    error_message = f"An error has occurred: {str(e)}. Please try again later. If the error persists, contact the administrator."
-                    st.error(error_message)
-                    # Add error message to chat history
-                    st.session_state.messages.append({"role": "assistant", "content": error_message})
+                
+                # Keep the history within the token budget, then format it if available
+                st.session_state.chat_history.trim(args.max_history_tokens)
+                chat_history = st.session_state.chat_history.pairs()
+                history_text = ""
+                if len(chat_history) > 0:
+                    history_text = "".join((
+                        "Chat History:\n",
+                        *(f"User: {past_question}\nAssistant: {past_response}\n\n"
+                          for past_question, past_response in chat_history)
+                    ))
+                
+                # Query with history included and pass chat_history for query preprocessing
+                response = st.write_stream(rag.query_stream(
+                    prompt, 
+                    system_prompt=None, 
+                    history=history_text,
+                    chat_history=chat_history or None
+                ))
+                
+                # Add assistant response to chat history
+                st.session_state.messages.append({"role": "assistant", "content": response})
+                
+                # Add to concise history queue (only question/answer pairs)
+                st.session_state.chat_history.add(prompt, response)
+            except Exception as e:
+                error_message = f"An error has occurred: {str(e)}. Please try again later. If the error persists, contact the administrator."
+                st.error(error_message)
+                # Add error message to chat history
+                st.session_state.messages.append({"role": "assistant", "content": error_message})
     
     # Clear chat button
     if st.button("Clear Chat"):
-        st.session_state.messages = []
+        st.session_state.messages.clear()
         st.session_state.chat_history.clear()
         st.rerun()
 
@@ -0,0 +1,44 @@
+from collections import deque
+from typing import List, Tuple
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) that works across LLM providers."""
+    return len(text) // 4 + 1
+
+class ChatHistory:
+    def __init__(self, depth: int):
+        """
+        Initialize an empty chat history.
+        
+        Args:
+            depth (int): Number of past interactions to keep. 0 disables the history.
+        """
+        # (question, answer, estimated tokens) per interaction, oldest first
+        self._interactions = deque(maxlen=depth)
+        # Running token total, so the budget check doesn't re-count every turn
+        self.tokens = 0
+    
+    def add(self, question: str, answer: str) -> None:
+        """Append an interaction, dropping the oldest one when the history is full."""
+        if not self._interactions.maxlen:
+            return
+        # The deque drops its oldest entry when full, so account for it first
+        if len(self._interactions) == self._interactions.maxlen:
+            self.tokens -= self._interactions[0][2]
+        n_tokens = estimate_tokens(question) + estimate_tokens(answer)
+        self._interactions.append((question, answer, n_tokens))
+        self.tokens += n_tokens
+    
+    def trim(self, max_tokens: int) -> None:
+        """Drop the oldest interactions until the history fits in the token budget."""
+        while self._interactions and self.tokens > max_tokens:
+            self.tokens -= self._interactions.popleft()[2]
+    
+    def pairs(self) -> List[Tuple[str, str]]:
+        """The kept interactions as (question, answer) pairs, oldest first."""
+        return [(question, answer) for question, answer, _ in self._interactions]
+    
+    def clear(self) -> None:
+        """Forget every interaction."""
+        self._interactions.clear()
+        self.tokens = 0
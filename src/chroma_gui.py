@@ -4,6 +4,9 @@ import chromadb
 from chromadb.config import Settings
 import json
 
+# Number of documents fetched per page when browsing a collection
+PAGE_SIZE = 500
+
 class ChromaDBBrowser(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -14,6 +17,10 @@ class ChromaDBBrowser(tk.Tk):
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(path="./chroma_db")
 
+        # Collection being browsed and how many of its documents are loaded
+        self.current_collection = None
+        self.loaded_offset = 0
+
         # Create main layout
         self.create_widgets()
         self.refresh_collections()
@@ -44,6 +51,9 @@ class ChromaDBBrowser(tk.Tk):
         self.doc_listbox.pack(fill=tk.X)
         self.doc_listbox.bind('<<ListboxSelect>>', self.on_document_select)
 
+        self.load_more_btn = ttk.Button(doc_frame, text="Load More", command=self.load_more_documents, state=tk.DISABLED)
+        self.load_more_btn.pack(anchor=tk.E, pady=5)
+
         # Document details
         details_frame = ttk.Frame(right_frame)
         details_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
@@ -54,9 +64,10 @@ class ChromaDBBrowser(tk.Tk):
 
     def refresh_collections(self):
         self.collection_listbox.delete(0, tk.END)
-        collections = self.client.list_collections()
-        for collection in collections:
-            self.collection_listbox.insert(tk.END, collection)
+        # Older Chroma versions return Collection objects rather than names
+        collections = [c.name if hasattr(c, 'name') else c for c in self.client.list_collections()]
+        # One insert call for all rows instead of one Tcl round-trip per row
+        self.collection_listbox.insert(tk.END, *collections)
 
     def on_collection_select(self, event):
         selection = self.collection_listbox.curselection()
@@ -64,22 +75,42 @@ class ChromaDBBrowser(tk.Tk):
             return
 
         collection_name = self.collection_listbox.get(selection[0])
-        collection = self.client.get_collection(collection_name)
+        self.current_collection = self.client.get_collection(collection_name)
+        self.loaded_offset = 0
+        self.doc_listbox.data = {'ids': [], 'documents': [], 'metadatas': []}
         
         # Clear previous documents
         self.doc_listbox.delete(0, tk.END)
         self.details_text.delete('1.0', tk.END)
 
-        # Get all documents in the collection
+        self.load_more_documents()
+
+    def load_more_documents(self):
+        if self.current_collection is None:
+            return
+
+        # Get the next page of documents; embeddings are only fetched for the selected document
         try:
-            results = collection.get()
-            for i, doc_id in enumerate(results['ids']):
-                display_text = f"{doc_id[:8]}... - {results['documents'][i][:50]}..."
-                self.doc_listbox.insert(tk.END, display_text)
-                # Store the full data for later retrieval
-                self.doc_listbox.data = results
+            results = self.current_collection.get(
+                limit=PAGE_SIZE,
+                offset=self.loaded_offset,
+                include=["documents", "metadatas"]
+            )
         except Exception as e:
             self.details_text.insert(tk.END, f"Error loading documents: {str(e)}")
+            return
+
+        # Store the full data for later retrieval
+        for key, values in self.doc_listbox.data.items():
+            values.extend(results[key] or [])
+        display_texts = [
+            f"{doc_id[:8]}... - {document[:50]}..."
+            for doc_id, document in zip(results['ids'], results['documents'])
+        ]
+        self.doc_listbox.insert(tk.END, *display_texts)
+
+        self.loaded_offset += len(results['ids'])
+        self.load_more_btn.config(state=tk.NORMAL if len(results['ids']) == PAGE_SIZE else tk.DISABLED)
 
     def on_document_select(self, event):
         selection = self.doc_listbox.curselection()
@@ -89,12 +120,16 @@ class ChromaDBBrowser(tk.Tk):
         idx = selection[0]
         results = self.doc_listbox.data
 
+        # Fetch the embedding of the selected document only
+        doc_id = results['ids'][idx]
+        embeddings = self.current_collection.get(ids=[doc_id], include=["embeddings"])['embeddings']
+
         # Format document details
         details = {
-            "ID": results['ids'][idx],
+            "ID": doc_id,
             "Document": results['documents'][idx],
             "Metadata": results['metadatas'][idx] if results['metadatas'] else {},
-            "Embeddings": results['embeddings'][idx] if results['embeddings'] else []
+            "Embeddings": [float(x) for x in embeddings[0]] if embeddings is not None and len(embeddings) else []
         }
 
         # Display formatted details
@@ -1,20 +1,93 @@
 import chromadb
+from chromadb.api.types import validate_metadata
 from chromadb.config import Settings
+from chromadb.utils import embedding_functions
 from typing import List, Optional, Dict, Any
+import atexit
+import heapq
+import os
+import threading
+import time
 import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from interfaces import IEmbeddingManager
 
+# HNSW index settings applied to every collection created by ChromaManager
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 200,
+    "hnsw:M": 32,
+    "hnsw:search_ef": 64
+}
+
+# Number of buffered add_document calls written to a collection in one add()
+ADD_BUFFER_SIZE = 128
+# Largest number of documents sent to Chroma in a single add() call
+MAX_ADD_BATCH = 250
+
+# Size and lifetime (seconds) of the query_similar result cache
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_TTL = 300
+
+# Lifetime (seconds) of the cached collection name list
+COLLECTION_NAMES_TTL = 5
+
+# Number of ids fetched and deleted per round when flushing a collection; kept below
+# Chroma's maximum write batch (5461 with SQLite's default variable limit), which deletes count against
+FLUSH_PAGE_SIZE = 5000
+
+# ONNX Runtime execution providers for the embedding model, in order of preference
+EMBEDDING_PROVIDERS = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+
+def default_embedding_function():
+    """
+    Chroma's default MiniLM embedding function, run on the GPU when ONNX Runtime supports CUDA.
+    
+    Returns:
+        The embedding function, using the first available of EMBEDDING_PROVIDERS
+    """
+    import onnxruntime
+    available = onnxruntime.get_available_providers()
+    providers = [provider for provider in EMBEDDING_PROVIDERS if provider in available]
+    return embedding_functions.ONNXMiniLM_L6_V2(preferred_providers=providers)
+
+def _flush_at_exit(manager_ref: "weakref.ref[ChromaManager]") -> None:
+    """atexit hook writing a ChromaManager's buffered documents, if the manager is still alive."""
+    manager = manager_ref()
+    if manager is not None:
+        manager.flush_pending()
+
 class ChromaManager(IEmbeddingManager):
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(self, persist_directory: str = "./chroma_db", embedding_function=None):
         """
         Initialize ChromaDB manager with optional persistence directory.
         
         Args:
             persist_directory (str): Directory where ChromaDB will store its data
+            embedding_function: Embedding function for all collections. If None, uses default_embedding_function()
         """
         # Initialize collections cache
         self._collections_cache = {}
+        self._cache_lock = threading.Lock()
+        # (timestamp, names) from the last list_collections call
+        self._coll_names_cache = None
+        # Shared by every collection so a query only needs to be embedded once
+        self.embedding_function = embedding_function or default_embedding_function()
+        # LRU cache of query_similar results: key -> (timestamp, results)
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        # Documents queued by add_document, per collection, until ADD_BUFFER_SIZE is reached
+        self._batch_size = ADD_BUFFER_SIZE
+        self._buffers: Dict[str, Dict[str, list]] = {}
+        self._buffer_lock = threading.Lock()
+        # A weak reference, so the hook doesn't keep every manager alive until exit
+        atexit.register(_flush_at_exit, weakref.ref(self))
+        # Reused by every multi-collection query; Chroma's index search releases the GIL
+        self._executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
         
+        self.persist_directory = persist_directory
         self.client = chromadb.Client(Settings(
             persist_directory=persist_directory,
             is_persistent=True
@@ -26,6 +99,11 @@ class ChromaManager(IEmbeddingManager):
         """
         Create a new collection or get existing one.
         
+        New collections are created with the HNSW settings in HNSW_METADATA.
+        Handles are cached, and opening a collection is safe from several threads.
+        Documents buffered by add_document for the collection are written first,
+        so reads through the returned handle see them.
+        
         Args:
             collection_name (str): Name of the collection
             
@@ -34,58 +112,236 @@ class ChromaManager(IEmbeddingManager):
         """
         if collection_name is None:
             collection_name = self.default_collection_name
+        
+        self._flush_collection(collection_name)
+        return self._get_collection(collection_name)
+    
+    def _get_collection(self, collection_name: str) -> chromadb.Collection:
+        """Get or create a collection handle without writing buffered documents."""
+        collection = self._collections_cache.get(collection_name)
+        if collection is not None:
+            return collection
+        
+        with self._cache_lock:
+            # Another thread may have opened the collection while we waited
+            if collection_name not in self._collections_cache:
+                # The collection may be new, so the cached name list can be out of date
+                self._coll_names_cache = None
+                self._collections_cache[collection_name] = self.client.get_or_create_collection(
+                    collection_name,
+                    metadata=HNSW_METADATA,
+                    embedding_function=self.embedding_function
+                )
+            collection = self._collections_cache[collection_name]
             
-        if collection_name in self._collections_cache:
-            return self._collections_cache[collection_name]
-            
-        try:
-            # Try to get existing collection
-            collection = self.client.get_collection(collection_name)
-        except chromadb.errors.InvalidCollectionException:
-            # Create new collection if it doesn't exist
-            collection = self.client.create_collection(collection_name)
-            
-        self._collections_cache[collection_name] = collection
         return collection
     
     def add_document(self, 
                     document: str, 
                     metadata: Optional[Dict[str, Any]] = None, 
                     doc_id: Optional[str] = None,
-                    collection_name: Optional[str] = None) -> str:
+                    collection_name: Optional[str] = None,
+                    embedding: Optional[Any] = None,
+                    upsert: Optional[bool] = None) -> str:
         """
         Add a document to the ChromaDB collection.
         
+        Documents are buffered per collection and written with a single add() or
+        upsert() call once the buffer holds ADD_BUFFER_SIZE documents. Pending
+        documents are written before any read or delete made through this manager,
+        when create_collection or list_collections is called, and at interpreter exit.
+        
+        The write is deferred: the returned ID may refer to a document that isn't
+        persisted yet, and buffered documents are lost if the process crashes before
+        they are written. Call flush_pending() when the write has to be durable.
+        Upserting an ID that is still buffered replaces the buffered document. If a
+        buffered write fails, its documents are dropped and the error is raised once,
+        from the call that triggered the write.
+        
         Args:
             document (str): The document text to add
             metadata (Optional[Dict[str, Any]]): Optional metadata for the document
             doc_id (Optional[str]): Optional document ID. If not provided, a UUID will be generated
             collection_name (Optional[str]): Name of the collection to add the document to
+            embedding (Optional[Any]): Optional precomputed embedding. If None, Chroma embeds the document
+            upsert (Optional[bool]): Overwrite an existing document with the same ID instead of failing.
+                                     If None, upserts when doc_id is given and adds otherwise.
             
         Returns:
             str: The ID of the added document
         """
+        if upsert is None:
+            # Caller-managed ids may already exist; generated UUIDs never collide
+            upsert = doc_id is not None
         if doc_id is None:
             doc_id = str(uuid.uuid4())
             
-        collection = self.collection if collection_name is None else self.create_collection(collection_name)
+        if collection_name is None:
+            collection_name = self.default_collection_name
+        # Validate now, so bad metadata fails this call rather than a later buffered write
+        metadata = validate_metadata(metadata) if metadata else {}
             
-        collection.add(
-            documents=[document],
-            metadatas=[metadata or {}],
-            ids=[doc_id]
-        )
+        with self._buffer_lock:
+            buffer = self._buffers.setdefault(collection_name, {
+                "documents": [], "metadatas": [], "ids": [], "embeddings": [], "upsert": []
+            })
+            if upsert and doc_id in buffer["ids"] and upsert == buffer["upsert"][0] \
+                    and (embedding is None) == (buffer["embeddings"][0] is None):
+                # Chroma rejects duplicate ids in one call; the last upsert wins
+                i = buffer["ids"].index(doc_id)
+                buffer["documents"][i] = document
+                buffer["metadatas"][i] = metadata
+                buffer["embeddings"][i] = embedding
+                self._invalidate_query_cache(collection_name)
+                return doc_id
+            # Chroma needs embeddings for all documents in a call or for none of them,
+            # one call either adds or upserts, and ids must be unique within a call
+            if buffer["ids"] and ((embedding is None) != (buffer["embeddings"][0] is None)
+                                  or upsert != buffer["upsert"][0]
+                                  or doc_id in buffer["ids"]):
+                self._flush_buffer(collection_name, buffer)
+            buffer["documents"].append(document)
+            buffer["metadatas"].append(metadata)
+            buffer["ids"].append(doc_id)
+            buffer["embeddings"].append(embedding)
+            buffer["upsert"].append(upsert)
+            self._invalidate_query_cache(collection_name)
+            
+            if len(buffer["ids"]) >= self._batch_size:
+                self._flush_buffer(collection_name, buffer)
         
         return doc_id
     
+    def _flush_buffer(self, collection_name: str, buffer: Dict[str, list]) -> None:
+        """
+        Write one collection's buffered documents in a single add() or upsert() call. Caller holds _buffer_lock.
+        
+        The buffer is emptied before the write, so a batch Chroma rejects is dropped
+        and its error is raised only to this caller instead of on every later flush.
+        """
+        if not buffer["ids"]:
+            return
+        pending = {key: list(values) for key, values in buffer.items()}
+        for values in buffer.values():
+            values.clear()
+        
+        collection = self._get_collection(collection_name)
+        write = collection.upsert if pending["upsert"][0] else collection.add
+        embeddings = pending["embeddings"] if pending["embeddings"][0] is not None else None
+        write(
+            documents=pending["documents"],
+            embeddings=embeddings,
+            metadatas=pending["metadatas"],
+            ids=pending["ids"]
+        )
+    
+    def flush_pending(self) -> None:
+        """
+        Write every document still buffered by add_document.
+        
+        A failed write doesn't stop the other collections from being flushed;
+        the first error is raised once they have all been tried.
+        """
+        error = None
+        with self._buffer_lock:
+            for collection_name, buffer in self._buffers.items():
+                try:
+                    self._flush_buffer(collection_name, buffer)
+                except Exception as e:
+                    print(f"Error writing buffered documents to collection {collection_name}: {str(e)}")
+                    error = error or e
+        if error is not None:
+            raise error
+    
+    def _flush_collection(self, collection_name: str) -> None:
+        """Write the documents buffered by add_document for one collection."""
+        with self._buffer_lock:
+            buffer = self._buffers.get(collection_name)
+            if buffer:
+                self._flush_buffer(collection_name, buffer)
+    
+    def add_documents(self,
+                      documents: List[str],
+                      metadatas: Optional[List[Dict[str, Any]]] = None,
+                      ids: Optional[List[str]] = None,
+                      collection_name: Optional[str] = None,
+                      embeddings: Optional[List[Any]] = None) -> List[str]:
+        """
+        Add several documents to a ChromaDB collection, bypassing the add_document buffer.
+        
+        Documents are sent to Chroma in slices of at most MAX_ADD_BATCH.
+        
+        Args:
+            documents (List[str]): The document texts to add
+            metadatas (Optional[List[Dict[str, Any]]]): Optional metadata, one dict per document
+            ids (Optional[List[str]]): Optional document IDs. If not provided, UUIDs will be generated
+            collection_name (Optional[str]): Name of the collection to add the documents to
+            embeddings (Optional[List[Any]]): Optional precomputed embeddings, one per document
+            
+        Returns:
+            List[str]: The IDs of the added documents
+        """
+        if not documents:
+            return []
+        
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in documents]
+            
+        collection = self.collection if collection_name is None else self.create_collection(collection_name)
+        
+        if metadatas is None:
+            metadatas = [{} for _ in documents]
+        
+        for start in range(0, len(documents), MAX_ADD_BATCH):
+            end = start + MAX_ADD_BATCH
+            collection.add(
+                documents=documents[start:end],
+                embeddings=embeddings[start:end] if embeddings is not None else None,
+                metadatas=metadatas[start:end],
+                ids=ids[start:end]
+            )
+        self._invalidate_query_cache(collection_name)
+        
+        return ids
+    
+    def embed(self, texts: List[str]) -> List[Any]:
+        """
+        Compute embeddings with the same function the collections use.
+        
+        Args:
+            texts (List[str]): Texts to embed
+            
+        Returns:
+            List[Any]: One embedding vector per input text
+        """
+        return self.embedding_function(texts)
+    
+    def _format_query_results(self, results: Dict[str, Any], collection_name: str) -> List[Dict[str, Any]]:
+        """Format raw Chroma query results into a more user-friendly structure."""
+        formatted_results = []
+        for i in range(len(results['ids'][0])):
+            formatted_results.append({
+                'id': results['ids'][0][i],
+                'document': results['documents'][0][i],
+                'metadata': results['metadatas'][0][i],
+                'distance': results['distances'][0][i] if 'distances' in results else None,
+                'collection': collection_name
+            })
+        return formatted_results
+    
     def query_similar(self, 
                      query_text: str, 
                      n_results: int = 5,
                      collection_names: Optional[List[str]] = None,
-                     results_per_collection: Optional[int] = None) -> List[Dict[str, Any]]:
+                     results_per_collection: Optional[int] = None,
+                     query_embedding: Optional[Any] = None) -> List[Dict[str, Any]]:
         """
         Query the collection(s) for documents similar to the input text.
         
+        The query text is embedded once and the vector is reused for every collection.
+        Results are cached for QUERY_CACHE_TTL seconds; writes to a collection drop
+        the cached results that include it.
+        
         Args:
             query_text (str): The text to find similar documents for
             n_results (int): Number of results to return
@@ -93,29 +349,78 @@ class ChromaManager(IEmbeddingManager):
             results_per_collection (Optional[int]): Number of results to fetch from each collection.
                                                     If None, uses n_results for the default collection
                                                     or distributes evenly among specified collections.
+            query_embedding (Optional[Any]): Embedding of query_text, if the caller already computed it
             
         Returns:
             List[Dict[str, Any]]: List of similar documents with their metadata and distances
         """
+        key = (query_text, n_results, tuple(sorted(collection_names or ())), results_per_collection)
+        with self._query_cache_lock:
+            entry = self._query_cache.get(key)
+            if entry is not None and time.monotonic() - entry[0] < QUERY_CACHE_TTL:
+                self._query_cache.move_to_end(key)
+                # Hand out copies so callers can't mutate the cached entries
+                return [dict(doc) for doc in entry[1]]
+        
+        if query_embedding is None:
+            query_embedding = self.embed([query_text])[0]
+        results = self.query_similar_with_embedding(
+            query_embedding,
+            n_results=n_results,
+            collection_names=collection_names,
+            results_per_collection=results_per_collection
+        )
+        
+        with self._query_cache_lock:
+            self._query_cache[key] = (time.monotonic(), [dict(doc) for doc in results])
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return results
+    
+    def _invalidate_query_cache(self, collection_name: Optional[str] = None) -> None:
+        """
+        Drop cached query results that were read from the given collection.
+        
+        Args:
+            collection_name (Optional[str]): Collection that was written to. If None, the default collection.
+        """
+        if collection_name is None:
+            collection_name = self.default_collection_name
+        with self._query_cache_lock:
+            stale_keys = [
+                key for key in self._query_cache
+                if collection_name in (key[2] or (self.default_collection_name,))
+            ]
+            for key in stale_keys:
+                del self._query_cache[key]
+    
+    def query_similar_with_embedding(self,
+                                     query_embedding: Any,
+                                     n_results: int = 5,
+                                     collection_names: Optional[List[str]] = None,
+                                     results_per_collection: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Query the collection(s) with a precomputed query embedding.
+        
+        Args:
+            query_embedding (Any): Embedding of the query text, as returned by embed()
+            n_results (int): Number of results to return
+            collection_names (Optional[List[str]]): List of collections to query from. If None, uses default collection.
+            results_per_collection (Optional[int]): Number of results to fetch from each collection.
+            
+        Returns:
+            List[Dict[str, Any]]: List of similar documents with their metadata and distances
+        """
+        self.flush_pending()
+        
         # If no specific collections are given, query only the default collection
         if not collection_names:
             results = self.collection.query(
-                query_texts=[query_text],
+                query_embeddings=[query_embedding],
                 n_results=n_results
             )
-            
-            # Format results into a more user-friendly structure
-            formatted_results = []
-            for i in range(len(results['ids'][0])):
-                formatted_results.append({
-                    'id': results['ids'][0][i],
-                    'document': results['documents'][0][i],
-                    'metadata': results['metadatas'][0][i],
-                    'distance': results['distances'][0][i] if 'distances' in results else None,
-                    'collection': self.default_collection_name
-                })
-                
-            return formatted_results
+            return self._format_query_results(results, self.default_collection_name)
         
         # Query from multiple collections
         all_results = []
@@ -124,34 +429,45 @@ class ChromaManager(IEmbeddingManager):
         if results_per_collection is None:
             results_per_collection = max(1, n_results // len(collection_names))
         
-        for collection_name in collection_names:
-            collection = self.create_collection(collection_name)
+        # Query collections concurrently and merge results as they complete
+        futures = {
+            self._executor.submit(self._query_one, name, query_embedding, results_per_collection): name
+            for name in collection_names
+        }
+        for future in as_completed(futures):
+            all_results.extend(future.result())
+        
+        # Keep the n_results closest documents; results without a distance sort last
+        return heapq.nsmallest(
+            n_results,
+            all_results,
+            key=lambda x: x['distance'] if x['distance'] is not None else float('inf')
+        )
+    
+    def _query_one(self, collection_name: str, query_embedding: Any, n_results: int) -> List[Dict[str, Any]]:
+        """
+        Query a single collection, returning no results if it is empty or the query fails.
+        
+        Args:
+            collection_name (str): Name of the collection to query
+            query_embedding (Any): Embedding of the query text
+            n_results (int): Number of results to fetch from the collection
             
-            # Skip empty collections to avoid errors
-            if collection.count() == 0:
-                continue
-                
-            try:
-                results = collection.query(
-                    query_texts=[query_text],
-                    n_results=results_per_collection
-                )
-                
-                # Format and add collection results
-                for i in range(len(results['ids'][0])):
-                    all_results.append({
-                        'id': results['ids'][0][i],
-                        'document': results['documents'][0][i],
-                        'metadata': results['metadatas'][0][i],
-                        'distance': results['distances'][0][i] if 'distances' in results else None,
-                        'collection': collection_name
-                    })
-            except Exception as e:
-                print(f"Error querying collection {collection_name}: {str(e)}")
-        
-        # Sort by distance and limit to n_results
-        all_results.sort(key=lambda x: x['distance'])
-        return all_results[:n_results]
+        Returns:
+            List[Dict[str, Any]]: Formatted results from this collection
+        """
+        collection = self.create_collection(collection_name)
+        
+        # Empty collections return empty ids, so no count() probe is needed first
+        try:
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results
+            )
+            return self._format_query_results(results, collection_name)
+        except Exception as e:
+            print(f"Error querying collection {collection_name}: {str(e)}")
+            return []
     
     def delete_documents_by_metadata(self, metadata_key: str, metadata_value: Any, collection_name: Optional[str] = None) -> None:
         """
@@ -162,16 +478,48 @@ class ChromaManager(IEmbeddingManager):
             metadata_value (Any): Value to match for the given key
             collection_name (Optional[str]): Name of the collection to delete from. If None, uses default collection.
         """
+        self.flush_pending()
         collection = self.collection if collection_name is None else self.create_collection(collection_name)
         
-        # Get all documents with matching metadata
-        results = collection.get(
-            where={metadata_key: metadata_value}
-        )
+        # Delete matching documents in one call instead of fetching their ids first
+        collection.delete(where={metadata_key: metadata_value})
+        self._invalidate_query_cache(collection_name)
+            
+    def delete_documents_by_sources(self, sources: List[str], collection_name: Optional[str] = None) -> None:
+        """
+        Delete all documents whose 'source' metadata is one of the given file names.
+        
+        Args:
+            sources (List[str]): Source file names to delete
+            collection_name (Optional[str]): Name of the collection to delete from. If None, uses default collection.
+        """
+        if not sources:
+            return
+        
+        self.flush_pending()
+        collection = self.collection if collection_name is None else self.create_collection(collection_name)
+        
+        # One delete for all files instead of one round-trip per file
+        collection.delete(where={'source': {'$in': list(sources)}})
+        self._invalidate_query_cache(collection_name)
+    
+    def has_documents(self, metadata_key: str, metadata_value: Any, collection_name: Optional[str] = None) -> bool:
+        """
+        Check whether any document matches the given metadata key-value pair.
         
-        if results["ids"]:
-            collection.delete(ids=results["ids"])
+        Args:
+            metadata_key (str): Metadata key to match
+            metadata_value (Any): Value to match for the given key
+            collection_name (Optional[str]): Name of the collection to search. If None, uses default collection.
             
+        Returns:
+            bool: True if at least one document matches
+        """
+        self.flush_pending()
+        collection = self.collection if collection_name is None else self.create_collection(collection_name)
+        # Only the ids are needed, and only one of them
+        return bool(collection.get(where={metadata_key: metadata_value}, limit=1, include=[])["ids"])
+    
     def get_documents_by_metadata(self, metadata_key: str, metadata_value: Any) -> List[Dict[str, Any]]:
         """
         Get all documents that match the given metadata key-value pair.
@@ -183,6 +531,7 @@ class ChromaManager(IEmbeddingManager):
         Returns:
             List[Dict[str, Any]]: List of matching documents with their metadata
         """
+        self.flush_pending()
         results = self.collection.get(
             where={metadata_key: metadata_value}
         )
@@ -201,21 +550,25 @@ class ChromaManager(IEmbeddingManager):
         """
         Delete all documents from the collection.
         
+        Ids are fetched without documents or embeddings and deleted FLUSH_PAGE_SIZE at a
+        time, so neither the id list nor a single delete grows with the collection.
+        
         Args:
             collection_name (Optional[str]): Name of the collection to flush. If None, flushes default collection.
         """
+        self.flush_pending()
         if collection_name is None:
-            # Get all document IDs from default collection
-            all_ids = self.collection.get()["ids"]
-            if all_ids:
-                # Delete all documents
-                self.collection.delete(ids=all_ids)
-        else:
-            # Flush specific collection
-            collection = self.create_collection(collection_name)
-            all_ids = collection.get()["ids"]
-            if all_ids:
-                collection.delete(ids=all_ids)
+            collection_name = self.default_collection_name
+        
+        # Delete the rows rather than the collection, so the collection keeps its id and
+        # handles held by other processes sharing the database stay valid
+        collection = self.create_collection(collection_name)
+        while True:
+            ids = collection.get(limit=FLUSH_PAGE_SIZE, include=[])["ids"]
+            if not ids:
+                break
+            collection.delete(ids=ids)
+        self._invalidate_query_cache(collection_name)
 
     def get_collection_stats(self, collection_name: Optional[str] = None) -> Dict[str, int]:
         """
@@ -227,6 +580,7 @@ class ChromaManager(IEmbeddingManager):
         Returns:
             Dict[str, int]: Dictionary containing collection statistics
         """
+        self.flush_pending()
         if collection_name is None:
             count = self.collection.count()
             return {
@@ -243,7 +597,20 @@ class ChromaManager(IEmbeddingManager):
         """
         List all collections in the database.
         
+        The names are cached for COLLECTION_NAMES_TTL seconds so repeated refreshes
+        don't hit the database.
+        
         Returns:
             List[str]: List of collection names
         """
-        return self.client.list_collections()
+        # A collection that so far only has buffered documents doesn't exist yet
+        self.flush_pending()
+        
+        cached = self._coll_names_cache
+        if cached is not None and time.monotonic() - cached[0] < COLLECTION_NAMES_TTL:
+            return list(cached[1])
+        
+        # Older Chroma versions return Collection objects rather than names
+        names = [c.name if hasattr(c, 'name') else c for c in self.client.list_collections()]
+        self._coll_names_cache = (time.monotonic(), names)
+        return list(names)
@@ -1,15 +1,47 @@
+import re
 import time
+import hashlib
+import json
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import os
 from embedding_manager import EmbeddingManager
 from pdf_chunker import PdfChunker
 from text_chunker import TextChunker
-from interfaces import IChunker
-from typing import Optional, Dict
+from interfaces import IChunker, TextChunk
+from typing import Optional, Dict, List
 import logging
 import argparse
-from threading import Timer
+import queue
+import signal
+import threading
+from collections import OrderedDict, namedtuple
+from threading import Thread, Condition, Lock, Event
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+# File extensions the watcher embeds (lowercase)
+SUPPORTED_EXTS = frozenset({'.txt', '.pdf', '.csv'})
+# Editor lock, backup and partial-download file names that are never embedded, whatever their extension
+IGNORE_PATTERN = re.compile(r'^(~\$|\.~lock\.|\.#)|(~|\.tmp|\.swp|\.part|\.crdownload)$', re.IGNORECASE)
+
+# Number of queued chunks that triggers a bulk add
+EMBED_BATCH_CHUNKS = 256
+# Seconds the queue may sit idle before queued chunks are added anyway
+EMBED_FLUSH_TIMEOUT = 0.5
+# Maximum number of queued jobs (file deletes or chunked files) before producers block
+JOB_QUEUE_SIZE = 256
+
+# Number of files processed concurrently after their debounce delay expires
+PROCESS_WORKERS = 2
+
+# Number of per-path processing locks kept before the least recently used idle ones are dropped
+MAX_PATH_LOCKS = 10_000
+
+# Manifest of processed files, used to skip files whose content hasn't changed
+# Lives in the Chroma persist directory, so it is removed together with the database
+MANIFEST_FILE = "watcher_manifest.json"
+# Block size used to stream a file through its manifest content hash
+MANIFEST_HASH_BLOCK = 1024 * 1024
 
 # Configure logging
 logging.basicConfig(
@@ -17,19 +49,87 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# A file path parsed once per event: full path, file name and lowercase extension
+FileRef = namedtuple("FileRef", "path name ext")
+
+def _fileref(file_path: str) -> FileRef:
+    """Split a file path into a FileRef."""
+    name = os.path.split(file_path)[1]
+    return FileRef(file_path, name, os.path.splitext(name)[1].lower())
+
+def _chunk_one(chunker: IChunker, file_path: str) -> Optional[List[TextChunk]]:
+    """
+    Chunk a file, returning None if it can't be read.
+    
+    Kept at module level so it can run in a worker process.
+    """
+    try:
+        return chunker.chunk_document(file_path)
+    except Exception as e:
+        logging.error(f"Error chunking {file_path}: {str(e)}")
+        return None
+
+def load_manifest(manifest_path: str) -> Dict[str, list]:
+    """
+    Load the processed-file manifest.
+    
+    Args:
+        manifest_path (str): Path of the manifest file
+    
+    Returns:
+        Dict[str, list]: [mtime, size, content hash] per absolute file path
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
 class DocumentHandler(FileSystemEventHandler):
-    def __init__(self, embedding_manager: EmbeddingManager, chunker: Optional[IChunker] = None):
+    def __init__(self, embedding_manager: EmbeddingManager, chunker: Optional[IChunker] = None,
+                 manifest: Optional[Dict[str, list]] = None, manifest_path: Optional[str] = None):
         """
         Initialize document handler with EmbeddingManager.
         
         Args:
             embedding_manager (EmbeddingManager): Instance of EmbeddingManager for document processing
+            chunker (Optional[IChunker]): Optional custom PDF chunker implementation
+            manifest (Optional[Dict[str, list]]): Signatures of already processed files, as returned by load_manifest
+            manifest_path (Optional[str]): Where the manifest is saved after each batch of processed files.
+                If None, MANIFEST_FILE in the Chroma persist directory
         """
         self.embedding_manager = embedding_manager
         self.pdf_chunker = chunker or PdfChunker()
         self.text_chunker = TextChunker()
-        self.processing_timers: Dict[str, Timer] = {}
         self.DEBOUNCE_SECONDS = 1  # Wait for 1 second of no events before processing
+        self.manifest = manifest if manifest is not None else {}
+        self.manifest_path = manifest_path or os.path.join(
+            embedding_manager.chroma_manager.persist_directory, MANIFEST_FILE
+        )
+        self._manifest_lock = Lock()
+        # Set when the in-memory manifest has changes that aren't saved yet
+        self._manifest_dirty = False
+        # Signatures of files queued for embedding but not yet recorded in the manifest,
+        # by absolute path; guarded by _manifest_lock
+        self._in_flight: Dict[str, list] = {}
+        # Least recently used first, bounded by MAX_PATH_LOCKS
+        self._path_locks: "OrderedDict[str, Lock]" = OrderedDict()
+        self._path_locks_lock = Lock()
+        
+        # Debounce deadlines per file path, served by a single scheduler thread
+        self.pending: Dict[str, float] = {}
+        self._pending_cond = Condition()
+        self._process_executor = ThreadPoolExecutor(max_workers=PROCESS_WORKERS)
+        self._scheduler = Thread(target=self._run_scheduler, daemon=True)
+        self._scheduler.start()
+        
+        # Deletes and chunked files are applied in order by a single embedding consumer
+        self.job_queue = queue.Queue(maxsize=JOB_QUEUE_SIZE)
+        self._shutdown_event = Event()
+        # Set by stop(); file events arriving afterwards are ignored
+        self._closed = Event()
+        self._embed_thread = Thread(target=self._embed_consumer, daemon=True)
+        self._embed_thread.start()
     
     def _get_topic_from_path(self, file_path: str) -> Optional[str]:
         """
@@ -44,101 +144,383 @@ class DocumentHandler(FileSystemEventHandler):
             return parts[-2]
         return None
         
-    def _is_supported_file(self, file_path: str) -> bool:
+    def _is_supported_file(self, ref: FileRef) -> bool:
         """Check if the file type is supported."""
-        supported_extensions = {'.txt', '.pdf', '.csv'}
-        return os.path.splitext(file_path)[1].lower() in supported_extensions
+        return ref.ext in SUPPORTED_EXTS and not IGNORE_PATTERN.search(ref.name)
     
-    def _get_chunker_for_file(self, file_path: str) -> IChunker:
+    def _get_chunker_for_file(self, ref: FileRef) -> IChunker:
         """Get appropriate chunker based on file type."""
-        file_extension = os.path.splitext(file_path)[1].lower()
-        if file_extension == '.pdf':
+        if ref.ext == '.pdf':
             return self.pdf_chunker
         else:
             return self.text_chunker
     
-    def _remove_file_chunks(self, file_path: str):
-        """Remove all chunks associated with a file."""
-        file_name = os.path.basename(file_path)
-        topic = self._get_topic_from_path(file_path)
+    def _file_metadata(self, ref: FileRef) -> Dict[str, str]:
+        """Metadata stored with every chunk of a file."""
+        topic = self._get_topic_from_path(ref.path)
+        return {
+            'source': ref.name,
+            'topic': topic if topic else 'default'
+        }
+    
+    def _path_lock(self, file_path: str) -> Lock:
+        """Get the lock that serializes processing of one file path."""
+        with self._path_locks_lock:
+            lock = self._path_locks.get(file_path)
+            if lock is None:
+                lock = self._path_locks[file_path] = Lock()
+            self._path_locks.move_to_end(file_path)
+            
+            # Drop the oldest locks nobody is holding, so long-running watchers don't grow without bound
+            stale = []
+            for path, path_lock in self._path_locks.items():
+                if len(self._path_locks) - len(stale) <= MAX_PATH_LOCKS:
+                    break
+                if not path_lock.locked():
+                    stale.append(path)
+            for path in stale:
+                del self._path_locks[path]
+            return lock
+    
+    def _file_signature(self, file_path: str) -> list:
+        """Content signature of a file: mtime, size and a hash of its full content."""
+        stat = os.stat(file_path)
         
-        logging.info(f"Removing existing chunks for {file_name}" + (f" from topic {topic}" if topic else ""))
+        # Same mtime and size as last time: trust the recorded hash instead of re-reading the file
+        known = self.manifest.get(os.path.abspath(file_path))
+        if known is not None and known[:2] == [stat.st_mtime, stat.st_size]:
+            return known
         
-        if topic:
-            # Remove from topic-specific collection
-            self.embedding_manager.chroma_manager.delete_documents_by_metadata('source', file_name, topic)
-        else:
-            # Remove from default collection
-            self.embedding_manager.chroma_manager.delete_documents_by_metadata('source', file_name)
+        content_hash = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(MANIFEST_HASH_BLOCK), b''):
+                content_hash.update(block)
+        return [stat.st_mtime, stat.st_size, content_hash.hexdigest()]
+    
+    def _is_unchanged(self, file_path: str, signature: list) -> bool:
+        """Check whether a file was already processed with the same content."""
+        known = self.manifest.get(os.path.abspath(file_path))
+        if known is None or known[1:] != signature[1:]:
+            return False
+        
+        # The database may have been deleted or edited since the manifest was written
+        ref = _fileref(file_path)
+        if not self.embedding_manager.chroma_manager.has_documents(
+                'source', ref.name, self._get_topic_from_path(file_path)):
+            return False
+        
+        # Metadata-only change (touch, chmod, editor save without edits): remember the new mtime
+        if known[0] != signature[0]:
+            self._update_manifest(file_path, signature)
+        return True
+    
+    def _is_in_flight(self, file_path: str, signature: list) -> bool:
+        """Check whether this version of a file is already queued for embedding."""
+        with self._manifest_lock:
+            queued = self._in_flight.get(os.path.abspath(file_path))
+        return queued is not None and queued[1:] == signature[1:]
+    
+    def _mark_in_flight(self, file_path: str, signature: list):
+        """Mark a version of a file as queued for embedding."""
+        with self._manifest_lock:
+            self._in_flight[os.path.abspath(file_path)] = signature
+    
+    def _clear_in_flight(self, file_path: str, signature: Optional[list] = None):
+        """
+        Drop a file's queued-for-embedding mark.
+        
+        With signature given, the mark is only dropped if it is still that version,
+        so a finished job doesn't clear the mark of a newer version queued after it.
+        """
+        with self._manifest_lock:
+            key = os.path.abspath(file_path)
+            if signature is None or self._in_flight.get(key) is signature:
+                self._in_flight.pop(key, None)
+    
+    def _update_manifest(self, file_path: str, signature: Optional[list]):
+        """Record (or, with signature None, forget) a file in the in-memory manifest; _save_manifest writes it."""
+        with self._manifest_lock:
+            key = os.path.abspath(file_path)
+            if signature is None:
+                if self.manifest.pop(key, None) is None:
+                    return
+            else:
+                self.manifest[key] = signature
+            self._manifest_dirty = True
+    
+    def _save_manifest(self):
+        """
+        Write the manifest atomically if it changed since it was last saved.
+        
+        Only called from the embedding consumer and, after it has exited, from stop(),
+        so two saves never race on the temporary file.
+        """
+        with self._manifest_lock:
+            if not self._manifest_dirty:
+                return
+            data = json.dumps(self.manifest)
+            self._manifest_dirty = False
+        
+        try:
+            os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+            tmp_path = f"{self.manifest_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError as e:
+            logging.error(f"Error saving manifest {self.manifest_path}: {str(e)}")
+            # Try again on the next flush
+            with self._manifest_lock:
+                self._manifest_dirty = True
+    
+    def _remove_file_chunks(self, ref: FileRef):
+        """Queue removal of all chunks associated with a file."""
+        topic = self._get_topic_from_path(ref.path)
+        
+        logging.info(f"Removing existing chunks for {ref.name}" + (f" from topic {topic}" if topic else ""))
+        
+        # Goes through the job queue so it can't overtake an add queued earlier for the same file
+        self.job_queue.put(("delete", topic, [ref.name]))
         
     def _process_file(self, file_path: str):
         """Process a file using EmbeddingManager."""
         try:
-            if not self._is_supported_file(file_path):
+            ref = _fileref(file_path)
+            if not self._is_supported_file(ref):
                 logging.info(f"Skipping unsupported file: {file_path}")
                 return
             
-            file_name = os.path.basename(file_path)
-            topic = self._get_topic_from_path(file_path)
-            
-            # Always remove existing chunks first
-            self._remove_file_chunks(file_path)
-            
-            logging.info(f"Processing file: {file_path}" + (f" for topic {topic}" if topic else ""))
-            
-            # Get chunks using appropriate chunker
-            chunker = self._get_chunker_for_file(file_path)
-            chunks = chunker.chunk_document(file_path)
-            
-            # Process each chunk
-            doc_ids = []
-            for chunk in chunks:
-                chunk_id = self.embedding_manager.add_file(
-                    file_path,
-                    metadata={
-                        'source': file_name,
-                        'topic': topic if topic else 'default'
-                    },
-                    text_content=chunk.text,
-                    collection_name=topic  # Use topic name as collection name if available
-                )
-                doc_ids.extend(chunk_id)
+            # Skip files whose content hasn't changed since they were last processed
+            signature = self._file_signature(file_path)
+            if self._is_unchanged(file_path, signature):
+                logging.info(f"Skipping unchanged file: {file_path}")
+                return
             
-            logging.info(f"Successfully processed {file_path}. Added {len(doc_ids)} chunks to " + 
-                        (f"topic {topic}" if topic else "default collection"))
+            # Only one thread may re-embed a given file at a time
+            with self._path_lock(file_path):
+                # Re-check: another thread may have just processed this version of the file,
+                # or queued it for the embedding consumer, which records it in the manifest later
+                signature = self._file_signature(file_path)
+                if self._is_unchanged(file_path, signature):
+                    logging.info(f"Skipping unchanged file: {file_path}")
+                    return
+                if self._is_in_flight(file_path, signature):
+                    logging.info(f"Skipping file already queued for embedding: {file_path}")
+                    return
+                
+                topic = self._get_topic_from_path(file_path)
+                
+                # Always remove existing chunks first
+                self._remove_file_chunks(ref)
+                
+                logging.info(f"Processing file: {file_path}" + (f" for topic {topic}" if topic else ""))
+                
+                # Get chunks using appropriate chunker
+                chunker = self._get_chunker_for_file(ref)
+                chunks = chunker.chunk_document(file_path)
+                
+                # The embedding consumer adds the chunks in batches with those of other files
+                self._mark_in_flight(file_path, signature)
+                self.job_queue.put(("add", ref, chunks, signature))
+                logging.info(f"Queued {len(chunks)} chunks from {file_path} for " + 
+                            (f"topic {topic}" if topic else "default collection"))
             
         except Exception as e:
             logging.error(f"Error processing {file_path}: {str(e)}")
     
+    def _process_files(self, file_paths: List[str]):
+        """
+        Process several files as a bulk load.
+        
+        Files are chunked in parallel worker processes, since PDF parsing is CPU-bound
+        Python code that holds the GIL. The embedding consumer thread adds the finished
+        chunks while later files are still being parsed.
+        """
+        # Skip unsupported files and files unchanged since they were last processed
+        signatures = {}
+        refs = {}
+        for file_path in file_paths:
+            ref = _fileref(file_path)
+            if self._is_supported_file(ref):
+                try:
+                    signature = self._file_signature(file_path)
+                except OSError as e:
+                    logging.error(f"Error reading {file_path}: {str(e)}")
+                    continue
+                if self._is_unchanged(file_path, signature):
+                    logging.info(f"Skipping unchanged file: {file_path}")
+                else:
+                    signatures[file_path] = signature
+                    refs[file_path] = ref
+        
+        file_paths = list(signatures)
+        
+        # Remove existing chunks with one delete per topic
+        sources_by_topic: Dict[Optional[str], List[str]] = {}
+        for file_path in file_paths:
+            sources_by_topic.setdefault(self._get_topic_from_path(file_path), []).append(refs[file_path].name)
+        for topic, sources in sources_by_topic.items():
+            logging.info(f"Removing existing chunks for {len(sources)} files" + (f" from topic {topic}" if topic else ""))
+            self.job_queue.put(("delete", topic, sources))
+        
+        executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        try:
+            futures = {
+                executor.submit(_chunk_one, self._get_chunker_for_file(refs[file_path]), file_path): file_path
+                for file_path in file_paths
+            }
+            for future in as_completed(futures):
+                chunks = future.result()
+                if chunks is not None:
+                    file_path = futures[future]
+                    self._mark_in_flight(file_path, signatures[file_path])
+                    self.job_queue.put(("add", refs[file_path], chunks, signatures[file_path]))
+        finally:
+            # On KeyboardInterrupt, drop files that haven't started parsing
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _embed_consumer(self):
+        """
+        Apply queued deletes and adds in order, adding chunks in batches.
+        
+        Queued files are added once EMBED_BATCH_CHUNKS chunks are waiting, when the queue
+        has been idle for EMBED_FLUSH_TIMEOUT seconds, and before any delete, so a file's
+        delete and re-add are applied in the order they were queued. Runs until
+        stop() is called and the queue is drained.
+        """
+        pending: Dict[Optional[str], list] = {}
+        pending_chunks = 0
+        
+        while True:
+            try:
+                job = self.job_queue.get(timeout=EMBED_FLUSH_TIMEOUT)
+            except queue.Empty:
+                job = None
+            
+            if job is None or job[0] == "delete":
+                self._flush_adds(pending)
+                pending_chunks = 0
+            
+            if job is None:
+                if self._shutdown_event.is_set():
+                    break
+            elif job[0] == "delete":
+                _, topic, sources = job
+                try:
+                    self.embedding_manager.chroma_manager.delete_documents_by_sources(sources, topic)
+                except Exception as e:
+                    logging.error(f"Error removing chunks for {', '.join(sources)}: {str(e)}")
+            else:
+                _, ref, chunks, signature = job
+                pending.setdefault(self._get_topic_from_path(ref.path), []).append((ref, chunks, signature))
+                pending_chunks += len(chunks)
+                if pending_chunks >= EMBED_BATCH_CHUNKS:
+                    self._flush_adds(pending)
+                    pending_chunks = 0
+    
+    def _flush_adds(self, pending: Dict[Optional[str], list]):
+        """Add the queued files of each topic with one bulk call, then record them in the manifest."""
+        for topic, files in pending.items():
+            groups = [(ref.path, chunks, self._file_metadata(ref)) for ref, chunks, _ in files]
+            try:
+                doc_ids = self.embedding_manager.add_chunk_groups(groups, collection_name=topic)
+                for ref, _, signature in files:
+                    self._update_manifest(ref.path, signature)
+                logging.info(f"Added {len(doc_ids)} chunks from {len(files)} files to " +
+                            (f"topic {topic}" if topic else "default collection"))
+            except Exception as e:
+                logging.error(f"Error adding files to " + (f"topic {topic}" if topic else "default collection") +
+                              f": {str(e)}")
+            finally:
+                # Recorded in the manifest or failed: either way the next event re-checks the file itself
+                for ref, _, signature in files:
+                    self._clear_in_flight(ref.path, signature)
+        pending.clear()
+        # One write for the whole flush, also covering manifest changes made by event threads
+        self._save_manifest()
+    
+    def stop(self):
+        """
+        Shut down gracefully: stop accepting file events, let files already being processed
+        finish, apply the queued deletes and adds, then flush ChromaDB's write buffers.
+        """
+        self._closed.set()
+        self.cancel_pending()
+        self._process_executor.shutdown(wait=True)
+        # The consumer exits once nothing more can be queued and the queue is drained
+        self._shutdown_event.set()
+        self._embed_thread.join()
+        self.embedding_manager.chroma_manager.flush_pending()
+        self._save_manifest()
+    
+    def _run_scheduler(self):
+        """Submit files for processing once DEBOUNCE_SECONDS have passed since their last event."""
+        with self._pending_cond:
+            while True:
+                now = time.monotonic()
+                due = [file_path for file_path, deadline in self.pending.items() if deadline <= now]
+                for file_path in due:
+                    del self.pending[file_path]
+                    try:
+                        self._process_executor.submit(self._process_file, file_path)
+                    except RuntimeError:
+                        # stop() already shut the executor down; the file is picked up on the next start
+                        pass
+                
+                # Sleep until the earliest deadline, or until a new event arrives
+                timeout = min(self.pending.values()) - now if self.pending else None
+                self._pending_cond.wait(timeout)
+    
     def _debounced_process_file(self, file_path: str):
         """Process file with debouncing to prevent duplicate processing."""
-        # Cancel any existing timer for this file
-        if file_path in self.processing_timers:
-            self.processing_timers[file_path].cancel()
-            
-        # Create new timer
-        timer = Timer(self.DEBOUNCE_SECONDS, self._process_file, args=[file_path])
-        self.processing_timers[file_path] = timer
-        timer.start()
+        if self._closed.is_set():
+            return
+        
+        # A new event pushes the file's deadline back
+        with self._pending_cond:
+            self.pending[file_path] = time.monotonic() + self.DEBOUNCE_SECONDS
+            self._pending_cond.notify()
+    
+    def cancel_pending(self):
+        """Drop all files still waiting for their debounce delay."""
+        with self._pending_cond:
+            self.pending.clear()
 
     def on_created(self, event):
         """Handle file creation events."""
-        if not event.is_directory:
+        # Ignore unsupported files before scheduling any work for them
+        if not event.is_directory and self._is_supported_file(_fileref(event.src_path)):
             self._debounced_process_file(event.src_path)
 
     def on_modified(self, event):
         """Handle file modification events."""
-        if not event.is_directory:
+        if not event.is_directory and self._is_supported_file(_fileref(event.src_path)):
             self._debounced_process_file(event.src_path)
     
     def on_deleted(self, event):
         """Handle file deletion events."""
         if not event.is_directory:
-            # Cancel any pending processing
-            if event.src_path in self.processing_timers:
-                self.processing_timers[event.src_path].cancel()
-                del self.processing_timers[event.src_path]
-            self._remove_file_chunks(event.src_path)
+            self._forget_file(event.src_path)
+    
+    def on_moved(self, event):
+        """Handle file rename events, e.g. an editor's atomic save of a temp file over the target."""
+        if event.is_directory:
+            return
+        if self._is_supported_file(_fileref(event.src_path)):
+            self._forget_file(event.src_path)
+        if self._is_supported_file(_fileref(event.dest_path)):
+            self._debounced_process_file(event.dest_path)
+    
+    def _forget_file(self, file_path: str):
+        """Cancel pending processing of a removed file and drop its chunks and manifest entry."""
+        if self._closed.is_set():
+            return
+        with self._pending_cond:
+            self.pending.pop(file_path, None)
+        # A re-created file with the same content must not be skipped as already queued
+        self._clear_in_flight(file_path)
+        self._update_manifest(file_path, None)
+        self._remove_file_chunks(_fileref(file_path))
 
 class DocumentWatcher:
     def __init__(self, watch_directory: str = "Docs", chunker: Optional[IChunker] = None, 
@@ -158,47 +540,65 @@ class DocumentWatcher:
         # Initialize managers and ensure collection exists
         self.embedding_manager = EmbeddingManager()
         
+        # Load the manifest of already processed files, kept next to the database
+        manifest_path = os.path.join(self.embedding_manager.chroma_manager.persist_directory, MANIFEST_FILE)
+        manifest = load_manifest(manifest_path)
+        
         # Ensure collection exists and handle database flushing
         _ = self.embedding_manager.chroma_manager.create_collection()
         if flush_database:
             logging.info("Flushing database...")
             self.embedding_manager.flush_db()
+            # Every file has to be embedded again
+            manifest = {}
         
-        self.event_handler = DocumentHandler(self.embedding_manager, chunker)
+        self.event_handler = DocumentHandler(self.embedding_manager, chunker, manifest, manifest_path)
         self.observer = Observer()
         
+    def _scan(self, root: str, rel_dir: str = ""):
+        """
+        Recursively yield (DirEntry, path relative to root) for everything under root.
+        
+        Directories are yielded before their contents.
+        """
+        with os.scandir(os.path.join(root, rel_dir)) as entries:
+            for entry in entries:
+                rel_path = os.path.join(rel_dir, entry.name)
+                yield entry, rel_path
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._scan(root, rel_path)
+    
     def _list_existing_files(self):
-        """List existing files in the watch directory and its subdirectories."""
-        if not os.path.exists(self.watch_directory):
-            os.makedirs(self.watch_directory)
-            logging.info(f"Created directory: {self.watch_directory}")
-            return [], [], []
-            
+        """
+        List existing files in the watch directory and its subdirectories.
+        
+        Returns:
+            Tuple of supported file paths (joined with the watch directory), unsupported
+            file paths relative to it, and topic directory names
+        """
+        # No separate existence check, which could race with another process creating it
+        os.makedirs(self.watch_directory, exist_ok=True)
+        
         supported_files = []
         unsupported_files = []
         topic_dirs = []
         
-        # First check for topic directories
-        for item in os.listdir(self.watch_directory):
-            item_path = os.path.join(self.watch_directory, item)
-            if os.path.isdir(item_path):
-                topic_dirs.append(item)
+        # Walk the tree once; DirEntry caches the file type from the directory listing
+        for entry, rel_path in self._scan(self.watch_directory):
+            if entry.is_dir(follow_symlinks=False):
+                # Directories directly inside the watch directory are topics
+                if os.sep not in rel_path:
+                    topic_dirs.append(entry.name)
+            elif entry.is_file():
+                if self.event_handler._is_supported_file(_fileref(entry.path)):
+                    # DirEntry.path is already joined with the watch directory
+                    supported_files.append(entry.path)
+                else:
+                    unsupported_files.append(rel_path)
         
         if topic_dirs:
             logging.info(f"Found topic directories: {', '.join(topic_dirs)}")
         
-        # Then check for files in both main directory and topic subdirectories
-        for root, _, files in os.walk(self.watch_directory):
-            for filename in files:
-                file_path = os.path.join(root, filename)
-                if self.event_handler._is_supported_file(file_path):
-                    # Store relative path from watch_directory
-                    rel_path = os.path.relpath(file_path, self.watch_directory)
-                    supported_files.append(rel_path)
-                else:
-                    rel_path = os.path.relpath(file_path, self.watch_directory)
-                    unsupported_files.append(rel_path)
-        
         if supported_files:
             logging.info("Found supported files:")
             for filename in supported_files:
@@ -213,19 +613,13 @@ class DocumentWatcher:
     
     def _process_existing_files(self):
         """Process existing files if embed_existing is True."""
-        if not os.path.exists(self.watch_directory):
-            os.makedirs(self.watch_directory)
-            logging.info(f"Created directory: {self.watch_directory}")
-            return
-            
-        supported_files, _, topic_dirs = self._list_existing_files()
+        # A single scan both lists the files and provides the paths to embed
+        supported_files, _, _ = self._list_existing_files()
         
         if self.embed_existing and supported_files:
             logging.info("Embedding existing files...")
-            for rel_path in supported_files:
-                file_path = os.path.join(self.watch_directory, rel_path)
-                # Process existing files directly without debouncing
-                self.event_handler._process_file(file_path)
+            # Process existing files directly without debouncing, as one bulk load per topic
+            self.event_handler._process_files(supported_files)
         
     def start(self):
         """Start the document watcher service."""
@@ -237,17 +631,28 @@ class DocumentWatcher:
         self.observer.start()
         logging.info(f"Started watching directory: {self.watch_directory} (including subdirectories)")
         
+        # Block on the observer instead of polling; Ctrl+C or SIGTERM stops it.
+        # Only the main thread may install signal handlers.
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self._shutdown)
+            signal.signal(signal.SIGTERM, self._shutdown)
+        
         try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            self.observer.stop()
-            # Cancel any pending timers
-            for timer in self.event_handler.processing_timers.values():
-                timer.cancel()
-            logging.info("Stopped watching directory")
-        
-        self.observer.join()
+            self.observer.join()
+        finally:
+            # Let files in flight and the embedding consumer finish what was already queued
+            self.event_handler.stop()
+    
+    def _shutdown(self, signum=None, frame=None):
+        """Stop watching the directory. Installed as the SIGINT/SIGTERM handler by start()."""
+        if signum is not None:
+            # A second Ctrl+C or SIGTERM during the drain in stop() terminates immediately
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        self.observer.stop()
+        # Drop files still waiting for their debounce delay
+        self.event_handler.cancel_pending()
+        logging.info("Stopped watching directory")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Document Watcher Service')
@@ -1,24 +1,123 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Iterable, Iterator
 import os
-import hashlib
-from chroma_manager import ChromaManager
+import logging
+from itertools import islice
+import multiprocessing
+import multiprocessing.pool
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from chroma_manager import ChromaManager, MAX_ADD_BATCH, default_embedding_function
 from pdf_chunker import PdfChunker
 from text_chunker import TextChunker
-from interfaces import IChunker, ChunkMetadata, TextChunk
+from interfaces import IChunker, ChunkMetadata, TextChunk, hash_text
+
+logger = logging.getLogger(__name__)
+
+# Default number of chunks sent to ChromaDB per add call; override with EMBEDDING_BATCH_SIZE
+BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "200"))
+
+# Minimum number of chunks before a file is worth embedding in a worker pool
+PARALLEL_EMBEDDING_MIN_CHUNKS = 64
+
+# PDFs with more pages than this are parsed in page ranges across worker processes
+PARALLEL_PDF_MIN_PAGES = 64
+# Minimum number of pages parsed by one worker task
+PDF_PAGES_PER_TASK = 32
+
+# Maximum number of files queued by add_file_async before callers block
+ASYNC_QUEUE_SIZE = 8
+# Seconds the background writer waits for more queued files before writing what it has
+ASYNC_FLUSH_TIMEOUT = 0.5
+
+# Number of successful batches after which a batch limit lowered by an out-of-memory error is doubled
+BATCH_RECOVERY_INTERVAL = 8
+
+# Embedding function of the current worker process, loaded by _init_embedding_worker
+_worker_embedding_function = None
+
+def _init_embedding_worker():
+    """Pool initializer loading the embedding model once per worker process."""
+    global _worker_embedding_function
+    _worker_embedding_function = default_embedding_function()
+
+def _embed_chunk(texts: List[str]) -> List[Any]:
+    """
+    Embed a batch of chunk texts inside a worker process.
+    
+    Kept at module level so it can be pickled by multiprocessing.
+    """
+    return _worker_embedding_function(texts)
+
+def _split_file_name(filepath: str) -> Tuple[str, str]:
+    """Base name and lowercase extension (with the dot) of a file path."""
+    file_name = os.path.basename(filepath)
+    return file_name, os.path.splitext(file_name)[1].lower()
+
+def _is_out_of_memory(error: Exception) -> bool:
+    """Check whether an error is the embedding model running out of (GPU or host) memory."""
+    if isinstance(error, MemoryError):
+        return True
+    # ONNX Runtime reports allocation failures as generic runtime errors
+    message = str(error).lower()
+    return "out of memory" in message or "failed to allocate" in message
 
 class EmbeddingManager:
     def __init__(self, chroma_manager: Optional[ChromaManager] = None,
-                 chunker: Optional[IChunker] = None):
+                 chunker: Optional[IChunker] = None,
+                 workers: int = 1):
         """
         Initialize EmbeddingManager with optional ChromaManager instance and chunking parameters.
         
         Args:
             chroma_manager (Optional[ChromaManager]): ChromaManager instance. If None, creates a new one
             chunker (Optional[IChunker]): Optional custom chunker implementation
+            workers (int): Number of worker processes used to embed large files. 1 disables the pool
         """
         self.chroma_manager = chroma_manager or ChromaManager()
         self.pdf_chunker = chunker or PdfChunker()
         self.text_chunker = TextChunker()
+        self.workers = max(1, workers)
+        # Embedding worker pool, started on first use and kept until close()
+        self._pool: Optional[multiprocessing.pool.Pool] = None
+        self._pool_lock = threading.Lock()
+        # Largest batch embedded at once; halved on out-of-memory errors and slowly raised again
+        self._batch_limit = MAX_ADD_BATCH
+        # Batches written since the limit was last changed, across calls
+        self._batch_successes = 0
+        # Queue of add_file_async, served by a writer thread started on first use
+        self._write_queue: Optional[queue.Queue] = None
+        self._writer_thread: Optional[threading.Thread] = None
+        self._write_queue_lock = threading.Lock()
+    
+    def _embed_in_pool(self, texts: List[str]) -> List[Any]:
+        """
+        Embed chunk texts across a pool of worker processes.
+        
+        Args:
+            texts (List[str]): Chunk texts to embed
+            
+        Returns:
+            List[Any]: One embedding per text, in input order
+        """
+        # One contiguous batch per worker keeps the model's own batching effective
+        batch_size = -(-len(texts) // self.workers)
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        embedded_batches = self._embedding_pool().map(_embed_chunk, batches)
+        
+        return [embedding for batch in embedded_batches for embedding in batch]
+    
+    def _embedding_pool(self) -> multiprocessing.pool.Pool:
+        """Get the embedding worker pool, starting it on first use."""
+        with self._pool_lock:
+            if self._pool is None:
+                # Spawn rather than fork: this process runs other threads and may
+                # already have ONNX Runtime loaded, which a forked child can deadlock on
+                self._pool = multiprocessing.get_context("spawn").Pool(
+                    self.workers, initializer=_init_embedding_worker
+                )
+            return self._pool
     
     def flush_db(self, collection_name: Optional[str] = None):
         """
@@ -42,7 +141,8 @@ class EmbeddingManager:
         return [c for c in collections if c != self.chroma_manager.default_collection_name]
         
     def add_file(self, filepath: str, metadata: Optional[Dict[str, Any]] = None, 
-                text_content: Optional[str] = None, collection_name: Optional[str] = None) -> List[str]:
+                text_content: Optional[str] = None, collection_name: Optional[str] = None,
+                batch_size: int = BATCH_SIZE) -> List[str]:
         """
         Process a file and add its chunks to ChromaDB.
         
@@ -51,52 +151,317 @@ class EmbeddingManager:
             metadata (Optional[Dict[str, Any]]): Optional metadata for the chunks
             text_content (Optional[str]): Optional pre-processed text content. If provided, skips file parsing
             collection_name (Optional[str]): Name of the collection to add chunks to
+            batch_size (int): Number of chunks sent to ChromaDB per add call
             
         Returns:
             List[str]: List of document IDs for the added chunks
         """
+        # Parse the path once; the name and extension feed both the chunker choice and the metadata
+        file_name, file_extension = _split_file_name(filepath)
+        base_metadata = self._base_metadata(file_name, file_extension, metadata)
+        
         # Handle pre-processed text content
         if text_content is not None:
             chunks = [TextChunk(
                 text=text_content,
                 metadata=ChunkMetadata(
-                    file_name=os.path.basename(filepath),
+                    file_name=file_name,
                     page_number=1,
-                    text_hash=hashlib.sha256(text_content.encode()).hexdigest()[:16]
+                    text_hash=hash_text(text_content)
                 )
             )]
         else:
             # Choose appropriate chunker based on file type
-            file_extension = os.path.splitext(filepath)[1].lower()
-            if file_extension == '.pdf':
+            if file_extension == '.pdf' and hasattr(self.pdf_chunker, 'iter_chunks'):
+                # Add pages batch by batch while the rest of the PDF is still being parsed
+                return self._add_chunk_stream(self._iter_pdf_chunks(filepath), base_metadata,
+                                              collection_name, batch_size)
+            elif file_extension == '.pdf':
                 chunks = self.pdf_chunker.chunk_document(filepath)
             else:
-                chunks = self.text_chunker.chunk_document(filepath)
+                # Text files are read one chunk at a time rather than loaded whole
+                return self._add_chunk_stream(self.text_chunker.iter_document_chunks(filepath), base_metadata,
+                                              collection_name, batch_size)
         
-        # Add base metadata
+        documents, metadatas = self._chunk_records(chunks, base_metadata)
+        return self._add_records(documents, metadatas, collection_name, batch_size)
+    
+    def add_file_async(self, filepath: str, metadata: Optional[Dict[str, Any]] = None,
+                       collection_name: Optional[str] = None) -> Future:
+        """
+        Chunk a file and queue its chunks to be added to ChromaDB by a background writer.
+        
+        The writer combines files queued close together into shared batches, so the caller
+        can chunk the next file while this one is being embedded and written. The
+        writer is a daemon thread: call close() before exiting, or files still queued
+        are dropped.
+        
+        Args:
+            filepath (str): Path to the file
+            metadata (Optional[Dict[str, Any]]): Optional metadata for the chunks
+            collection_name (Optional[str]): Name of the collection to add chunks to
+            
+        Returns:
+            Future: Resolves to the list of document IDs once the chunks are written
+        """
+        file_name, file_extension = _split_file_name(filepath)
+        chunker = self.pdf_chunker if file_extension == '.pdf' else self.text_chunker
+        documents, metadatas = self._chunk_records(chunker.chunk_document(filepath),
+                                                   self._base_metadata(file_name, file_extension, metadata))
+        
+        future = Future()
+        self._writer_queue().put((documents, metadatas, collection_name, future))
+        return future
+    
+    def _writer_queue(self) -> queue.Queue:
+        """Get the add_file_async queue, starting its writer thread on first use."""
+        with self._write_queue_lock:
+            if self._write_queue is None:
+                self._write_queue = queue.Queue(maxsize=ASYNC_QUEUE_SIZE)
+                self._writer_thread = threading.Thread(
+                    target=self._drain_write_queue, args=(self._write_queue,), daemon=True
+                )
+                self._writer_thread.start()
+            return self._write_queue
+    
+    def close(self):
+        """Write every file queued by add_file_async, then stop the background writer and the embedding pool."""
+        with self._write_queue_lock:
+            write_queue, writer_thread = self._write_queue, self._writer_thread
+            self._write_queue = self._writer_thread = None
+        if write_queue is not None:
+            # None tells the writer to stop once everything queued before it is written
+            write_queue.put(None)
+            writer_thread.join()
+        
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+    
+    def _drain_write_queue(self, write_queue: queue.Queue):
+        """
+        Write files queued by add_file_async until close() queues None.
+        
+        Queued files are collected until BATCH_SIZE chunks are waiting or ASYNC_FLUSH_TIMEOUT
+        seconds have passed, then written with one bulk add per collection.
+        """
+        closing = False
+        while not closing:
+            item = write_queue.get()
+            if item is None:
+                break
+            pending = [item]
+            pending_chunks = len(item[0])
+            deadline = time.monotonic() + ASYNC_FLUSH_TIMEOUT
+            while pending_chunks < BATCH_SIZE:
+                try:
+                    item = write_queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                pending.append(item)
+                pending_chunks += len(item[0])
+            
+            by_collection: Dict[Optional[str], list] = {}
+            for item in pending:
+                by_collection.setdefault(item[2], []).append(item)
+            
+            for collection_name, items in by_collection.items():
+                documents = [document for item in items for document in item[0]]
+                metadatas = [record for item in items for record in item[1]]
+                try:
+                    doc_ids = self._add_records(documents, metadatas, collection_name, BATCH_SIZE)
+                except Exception as e:
+                    for *_, future in items:
+                        future.set_exception(e)
+                    continue
+                
+                # Hand each file the IDs of its own chunks
+                offset = 0
+                for item_documents, _, _, future in items:
+                    future.set_result(doc_ids[offset:offset + len(item_documents)])
+                    offset += len(item_documents)
+    
+    def add_bytes(self, data: bytes, filename: str, metadata: Optional[Dict[str, Any]] = None,
+                  collection_name: Optional[str] = None, batch_size: int = BATCH_SIZE) -> List[str]:
+        """
+        Process an in-memory file and add its chunks to ChromaDB.
+        
+        Args:
+            data (bytes): Raw file content
+            filename (str): Original file name, used to pick the chunker and as source metadata
+            metadata (Optional[Dict[str, Any]]): Optional metadata for the chunks
+            collection_name (Optional[str]): Name of the collection to add chunks to
+            batch_size (int): Number of chunks sent to ChromaDB per add call
+            
+        Returns:
+            List[str]: List of document IDs for the added chunks
+        """
+        # Choose appropriate chunker based on file type
+        file_extension = os.path.splitext(filename)[1].lower()
+        if file_extension == '.pdf':
+            chunks = self.pdf_chunker.chunk_bytes(data, filename)
+        else:
+            chunks = self.text_chunker.chunk_bytes(data, filename)
+        
+        return self.add_chunks(chunks, filename, metadata, collection_name, batch_size)
+    
+    def add_chunks(self, chunks: List[TextChunk], filepath: str, metadata: Optional[Dict[str, Any]] = None,
+                   collection_name: Optional[str] = None, batch_size: int = BATCH_SIZE) -> List[str]:
+        """
+        Add already chunked text of one file to ChromaDB in batches of batch_size.
+        
+        Args:
+            chunks (List[TextChunk]): Chunks produced by a chunker
+            filepath (str): Path or name of the file the chunks came from
+            metadata (Optional[Dict[str, Any]]): Optional metadata for the chunks
+            collection_name (Optional[str]): Name of the collection to add chunks to
+            batch_size (int): Number of chunks sent to ChromaDB per add call
+            
+        Returns:
+            List[str]: List of document IDs for the added chunks
+        """
+        documents, metadatas = self._chunk_records(chunks, self._base_metadata(*_split_file_name(filepath), metadata))
+        return self._add_records(documents, metadatas, collection_name, batch_size)
+    
+    def _iter_pdf_chunks(self, filepath: str) -> Iterator[TextChunk]:
+        """
+        Lazily chunk a PDF, in page order.
+        
+        PDFs of more than PARALLEL_PDF_MIN_PAGES pages are split into page ranges that are
+        parsed in worker processes, since text extraction is CPU-bound.
+        """
+        workers = os.cpu_count() or 1
+        # Only count pages when the PDF could actually be split across workers
+        page_count = 0
+        if workers > 1 and hasattr(self.pdf_chunker, 'page_count'):
+            page_count = self.pdf_chunker.page_count(filepath)
+        if page_count <= PARALLEL_PDF_MIN_PAGES:
+            yield from self.pdf_chunker.iter_chunks(filepath)
+            return
+        
+        pages_per_task = max(PDF_PAGES_PER_TASK, -(-page_count // workers))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(self.pdf_chunker.chunk_document, filepath, (start, min(start + pages_per_task, page_count)))
+                for start in range(0, page_count, pages_per_task)
+            ]
+            # Earlier ranges are added while later ones are still being parsed
+            for future in futures:
+                yield from future.result()
+    
+    def _add_chunk_stream(self, chunks: Iterable[TextChunk], base_metadata: Dict[str, Any],
+                          collection_name: Optional[str], batch_size: int) -> List[str]:
+        """Add lazily produced chunks of one file, batch_size chunks at a time."""
+        chunks = iter(chunks)
+        doc_ids = []
+        while True:
+            batch = list(islice(chunks, batch_size))
+            if not batch:
+                break
+            documents, metadatas = self._chunk_records(batch, base_metadata, first_index=len(doc_ids))
+            doc_ids.extend(self._add_records(documents, metadatas, collection_name, batch_size))
+        return doc_ids
+    
+    def add_chunk_groups(self, groups: List[Tuple[str, List[TextChunk], Optional[Dict[str, Any]]]],
+                         collection_name: Optional[str] = None, batch_size: int = BATCH_SIZE) -> List[str]:
+        """
+        Add the chunks of several files to one collection as a single bulk load.
+        
+        Chunks of all files are embedded together and written in batches of batch_size,
+        so small files don't each pay for their own embedding and ChromaDB calls.
+        
+        Args:
+            groups (List[Tuple[str, List[TextChunk], Optional[Dict[str, Any]]]]): (filepath, chunks, metadata) per file
+            collection_name (Optional[str]): Name of the collection to add chunks to
+            batch_size (int): Number of chunks sent to ChromaDB per add call
+            
+        Returns:
+            List[str]: List of document IDs for the added chunks
+        """
+        documents, metadatas = [], []
+        for filepath, chunks, metadata in groups:
+            file_documents, file_metadatas = self._chunk_records(
+                chunks, self._base_metadata(*_split_file_name(filepath), metadata)
+            )
+            documents.extend(file_documents)
+            metadatas.extend(file_metadatas)
+        
+        return self._add_records(documents, metadatas, collection_name, batch_size)
+    
+    def _base_metadata(self, file_name: str, file_extension: str,
+                       metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Metadata shared by every chunk of one file."""
         base_metadata = {
-            'source_file': os.path.basename(filepath),
-            'file_type': os.path.splitext(filepath)[1].lower()[1:],  # Remove the dot
+            'source_file': file_name,
+            'file_type': file_extension[1:],  # Remove the dot
         }
         if metadata:
             base_metadata.update(metadata)
-        
-        # Add chunks to ChromaDB
-        doc_ids = []
-        for chunk in chunks:
-            # Add chunk metadata
-            chunk_metadata = {**base_metadata}
-            chunk_metadata.update({
+        return base_metadata
+    
+    def _chunk_records(self, chunks: List[TextChunk], base_metadata: Dict[str, Any],
+                       first_index: int = 0) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """Build the document texts and metadata records for the chunks of one file, numbered from first_index."""
+        # Build each record in a single literal; only the chunk fields differ between chunks
+        documents = [chunk.text for chunk in chunks]
+        metadatas = [
+            {
+                **base_metadata,
+                'chunk_index': chunk_index,
                 'page_number': chunk.metadata.page_number,
                 'text_hash': chunk.metadata.text_hash
-            })
+            }
+            for chunk_index, chunk in enumerate(chunks, first_index)
+        ]
+        
+        return documents, metadatas
+    
+    def _add_records(self, documents: List[str], metadatas: List[Dict[str, Any]],
+                     collection_name: Optional[str], batch_size: int) -> List[str]:
+        """Embed and add document records to ChromaDB one batch at a time."""
+        # Embed large loads across worker processes, otherwise let Chroma embed each batch
+        embeddings = None
+        if self.workers > 1 and len(documents) >= PARALLEL_EMBEDDING_MIN_CHUNKS:
+            embeddings = self._embed_in_pool(documents)
+        
+        doc_ids = []
+        start = 0
+        while start < len(documents):
+            size = min(batch_size, self._batch_limit)
+            end = start + size
+            try:
+                doc_ids.extend(self._add_batch(documents[start:end], metadatas[start:end], embeddings, start, collection_name))
+            except Exception as e:
+                if not _is_out_of_memory(e) or size == 1:
+                    raise
+                # Retry the same chunks in smaller batches instead of failing the whole file
+                self._batch_limit = max(1, size // 2)
+                self._batch_successes = 0
+                logger.warning("Out of memory embedding %d chunks, retrying with batches of %d",
+                               size, self._batch_limit)
+                continue
             
-            # Add to ChromaDB with optional collection name
-            doc_id = self.chroma_manager.add_document(
-                document=chunk.text,
-                metadata=chunk_metadata,
-                collection_name=collection_name
-            )
-            doc_ids.append(doc_id)
+            start = end
+            if self._batch_limit < MAX_ADD_BATCH:
+                self._batch_successes += 1
+                if self._batch_successes >= BATCH_RECOVERY_INTERVAL:
+                    self._batch_limit = min(MAX_ADD_BATCH, self._batch_limit * 2)
+                    self._batch_successes = 0
         
         return doc_ids
+    
+    def _add_batch(self, documents: List[str], metadatas: List[Dict[str, Any]],
+                   embeddings: Optional[List[Any]], offset: int,
+                   collection_name: Optional[str]) -> List[str]:
+        """Add one batch of chunks, slicing the matching precomputed embeddings if any."""
+        return self.chroma_manager.add_documents(
+            documents=documents,
+            metadatas=metadatas,
+            embeddings=embeddings[offset:offset + len(documents)] if embeddings is not None else None,
+            collection_name=collection_name
+        )
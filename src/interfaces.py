@@ -1,18 +1,39 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from pathlib import Path
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 from dataclasses import dataclass
 
-@dataclass
+# System prompt used when a query doesn't provide one
+DEFAULT_SYSTEM_PROMPT = (
+    "You are a helpful multilingual AI assistant. Use the provided context to answer the user's question.\n"
+    "If the context doesn't contain relevant information, say so. Always base your answers on the provided context.\n"
+    "If the context has the source name and maybe page number, mention it at the end of your response.\n"
+    "\n"
+    "Important:\n"
+    "- Detect the language of the user's original question\n"
+    "- Respond in the SAME LANGUAGE as the user's original question\n"
+    "- Your response must be in streamlit markdown format"
+)
+
+@dataclass(slots=True)
 class ChunkMetadata:
     file_name: str
     page_number: int
     text_hash: str
 
-@dataclass
+@dataclass(slots=True)
 class TextChunk:
     text: str
     metadata: ChunkMetadata
 
+def hash_text(text: str) -> str:
+    """Short content hash stored as a chunk's text_hash."""
+    return hashlib.sha256(text.encode()).digest()[:8].hex()
+
 class IChunker(ABC):
     """Interface for document chunking implementations."""
     
@@ -20,6 +41,24 @@ class IChunker(ABC):
     def chunk_document(self, file_path: str) -> List[TextChunk]:
         """Chunk a document into smaller pieces with metadata."""
         pass
+    
+    def chunk_bytes(self, data: bytes, file_name: str) -> List[TextChunk]:
+        """
+        Chunk an in-memory document.
+        
+        The default implementation writes the bytes to a temporary file and calls
+        chunk_document. Chunkers that can parse from memory should override it.
+        """
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(file_name)[1], delete=False) as tmp:
+            tmp.write(data)
+        try:
+            chunks = self.chunk_document(tmp.name)
+        finally:
+            Path(tmp.name).unlink(missing_ok=True)
+        
+        for chunk in chunks:
+            chunk.metadata.file_name = file_name
+        return chunks
 
 class IEmbeddingManager(ABC):
     """Interface for embedding management implementations."""
@@ -30,8 +69,14 @@ class IEmbeddingManager(ABC):
         pass
         
     @abstractmethod
-    def query_similar(self, query_text: str, n_results: int = 5) -> List[Dict[str, Any]]:
-        """Query for similar documents."""
+    def query_similar(self, query_text: str, n_results: int = 5,
+                      query_embedding: Optional[Any] = None) -> List[Dict[str, Any]]:
+        """Query for similar documents, reusing query_embedding if it was already computed for query_text."""
+        pass
+    
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[Any]:
+        """Compute embeddings with the same function used for stored documents."""
         pass
         
     @abstractmethod
@@ -49,6 +94,28 @@ class ILLM(ABC):
                          system_prompt: Optional[str] = None) -> str:
         """Generate a response based on context and query."""
         pass
+    
+    async def agenerate_response(self,
+                                 context: str,
+                                 query: str,
+                                 system_prompt: Optional[str] = None) -> str:
+        """
+        Asynchronously generate a response based on context and query.
+        
+        Runs generate_response in a worker thread unless overridden with a native async client.
+        """
+        return await asyncio.to_thread(self.generate_response, context, query, system_prompt)
+    
+    def stream_response(self,
+                        context: str,
+                        query: str,
+                        system_prompt: Optional[str] = None) -> Iterator[str]:
+        """
+        Generate a response and yield it piece by piece as it is produced.
+        
+        Yields the complete response at once unless overridden with a streaming client.
+        """
+        yield self.generate_response(context, query, system_prompt)
 
 class BaseRAG:
     """Base class for RAG implementations."""
@@ -57,11 +124,16 @@ class BaseRAG:
                  llm: ILLM,
                  embedding_manager: IEmbeddingManager,
                  context_limit: int = 5,
-                 use_query_preprocessing: bool = False):
+                 use_query_preprocessing: bool = False,
+                 use_response_cache: bool = False,
+                 speculative_retrieval: bool = False):
         self.llm = llm
         self.embedding_manager = embedding_manager
         self.context_limit = context_limit
         self.use_query_preprocessing = use_query_preprocessing
+        # In aquery, retrieve for the raw query while it is being rewritten. Costs an extra
+        # embedding and retrieval whenever the rewrite changes the query
+        self.speculative_retrieval = speculative_retrieval
         self.query_preprocessor = None
         self.selected_topics = []  # Default to no specific topics (use default collection)
         self.results_per_topic = 2  # Default number of results to fetch per topic
@@ -70,22 +142,40 @@ class BaseRAG:
         if self.use_query_preprocessing:
             from query_preprocessor import QueryPreprocessor
             self.query_preprocessor = QueryPreprocessor(llm)
+        
+        # If response caching is enabled, answer near-identical first questions from the cache.
+        # Documents are ingested by the watcher in another process, so new documents can't
+        # invalidate cached answers; they become visible once entries expire after the TTL
+        self.response_cache = None
+        if use_response_cache:
+            from semantic_cache import SemanticCache
+            self.response_cache = SemanticCache(tau=0.9, ttl=600, max_entries=1024)
     
     def _format_context(self, documents: List[Dict[str, Any]]) -> str:
         """Format retrieved documents into a context string."""
-        context_parts = []
+        return "\n".join(self._format_document(doc) for doc in documents)
+    
+    def _format_document(self, doc: Dict[str, Any]) -> str:
+        """Format one retrieved document with its distance, topic and metadata."""
+        metadata_str = ", ".join(f"{k}: {v}" for k, v in doc['metadata'].items())
+        # Include collection/topic name if available
+        collection_info = f", Topic: {doc['collection']}" if 'collection' in doc else ""
+        return f"[Document (Distance: {doc['distance']:.4f}{collection_info}, {metadata_str})]\n{doc['document']}\n"
+    
+    def _deduplicate(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop documents whose text was already retrieved, keeping the closest copy."""
+        seen = set()
+        deduplicated = []
+        for doc in sorted(documents, key=lambda d: d['distance']):
+            text_hash = hashlib.md5(doc['document'].encode()).digest()
+            if text_hash not in seen:
+                seen.add(text_hash)
+                deduplicated.append(doc)
         
-        for doc in documents:
-            metadata_str = ", ".join(f"{k}: {v}" for k, v in doc['metadata'].items())
-            # Include collection/topic name if available
-            collection_info = f", Topic: {doc.get('collection', 'default')}" if 'collection' in doc else ""
-            
-            context_parts.append(
-                f"[Document (Distance: {doc['distance']:.4f}{collection_info}, {metadata_str})]\n"
-                f"{doc['document']}\n"
-            )
-            
-        return "\n".join(context_parts)
+        dropped = len(documents) - len(deduplicated)
+        if dropped:
+            print(f"Dropped {dropped} duplicate document(s) from the context")
+        return deduplicated
     
     def set_selected_topics(self, topics: List[str], results_per_topic: int = None):
         """
@@ -99,52 +189,84 @@ class BaseRAG:
         if results_per_topic is not None:
             self.results_per_topic = results_per_topic
     
-    def query(self, user_query: str, system_prompt: Optional[str] = None, history: str = "", 
-              chat_history: List[Tuple[str, str]] = None) -> str:
-        """Process a user query using RAG."""
-        search_query = user_query
+    def _retrieve(self, search_query: str, query_embedding: Optional[Any] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieve documents for a search query.
         
-        # Use query preprocessing if enabled, even for the first query with no history
-        if self.use_query_preprocessing and self.query_preprocessor:
-            print("\n----- QUERY PREPROCESSING -----")
-            print(f"Input query: {user_query}")
-            print(f"Chat history: {str(chat_history)[:100] + '...' if chat_history and len(str(chat_history)) > 100 else str(chat_history)}")
-            
-            search_query = self.query_preprocessor.enrich_query(
-                query=user_query,
-                chat_history=chat_history
-            )
+        The query is normalized first so that the embedding manager's result
+        cache is shared by queries differing only in case or surrounding whitespace.
+        
+        Args:
+            search_query (str): The (potentially enriched) query text
+            query_embedding (Optional[Any]): Embedding of the normalized query, if already computed
             
-            print(f"Output enriched query: {search_query}")
-            print("--------------------------------\n")
+        Returns:
+            List[Dict[str, Any]]: List of similar documents with their metadata and distances
+        """
+        norm_query = search_query.strip().lower()
         
-        # Get similar documents using the (potentially enriched) query
         if self.selected_topics:
-            print(f"Querying selected topics: {', '.join(self.selected_topics)}")
-            similar_docs = self.embedding_manager.query_similar(
-                query_text=search_query,
+            return self.embedding_manager.query_similar(
+                query_text=norm_query,
                 n_results=self.context_limit,
                 collection_names=self.selected_topics,
-                results_per_collection=self.results_per_topic
-            )
-        else:
-            # If no topics selected, use default collection
-            similar_docs = self.embedding_manager.query_similar(
-                query_text=search_query,
-                n_results=self.context_limit
+                results_per_collection=self.results_per_topic,
+                query_embedding=query_embedding
             )
+        # If no topics selected, use default collection
+        return self.embedding_manager.query_similar(
+            query_text=norm_query,
+            n_results=self.context_limit,
+            query_embedding=query_embedding
+        )
+    
+    def _response_cache_key(self, user_query: str, system_prompt: Optional[str], history: str,
+                            chat_history: List[Tuple[str, str]], no_cache: bool) -> Optional[Tuple[Any, Tuple]]:
+        """
+        Build the semantic cache lookup for a query.
         
-        context = self._format_context(similar_docs)
+        Only queries without conversation history are cached, since history changes the answer.
+        The embedding is of the normalized query, so retrieval can reuse it when the query
+        isn't rewritten. Cached answers may miss documents ingested in the last TTL seconds.
+        
+        Returns:
+            Optional[Tuple[Any, Tuple]]: (query embedding, namespace), or None if the query must not be cached
+        """
+        if self.response_cache is None or no_cache or history or chat_history:
+            return None
+        
+        embedding = self.embedding_manager.embed([user_query.strip().lower()])[0]
+        namespace = (tuple(self.selected_topics), system_prompt, self.context_limit, self.results_per_topic)
+        return embedding, namespace
+    
+    def _preprocess_query(self, user_query: str, chat_history: List[Tuple[str, str]] = None) -> str:
+        """Translate and enrich the user query for retrieval."""
+        print("\n----- QUERY PREPROCESSING -----")
+        print(f"Input query: {user_query}")
+        print(f"Chat history: {str(chat_history)[:100] + '...' if chat_history and len(str(chat_history)) > 100 else str(chat_history)}")
+        
+        search_query = self.query_preprocessor.enrich_query(
+            query=user_query,
+            chat_history=chat_history
+        )
+        
+        print(f"Output enriched query: {search_query}")
+        print("--------------------------------\n")
+        return search_query
+    
+    def _prepare_generation(self, user_query: str, similar_docs: List[Dict[str, Any]],
+                            system_prompt: Optional[str], history: str) -> Tuple[str, str, str]:
+        """
+        Build the context, query and system prompt sent to the LLM.
+        
+        Returns:
+            Tuple[str, str, str]: (context, query, system_prompt)
+        """
+        # Deduplicated documents stay in relevance (distance) order
+        context = self._format_context(self._deduplicate(similar_docs))
         
         if system_prompt is None:
-            system_prompt = """You are a helpful multilingual AI assistant. Use the provided context to answer the user's question.
-            If the context doesn't contain relevant information, say so. Always base your answers on the provided context.
-            If the context has the source name and maybe page number, mention it at the end of your response.
-            
-            Important: 
-            - Detect the language of the user's original question
-            - Respond in the SAME LANGUAGE as the user's original question
-            - Your response must be in streamlit markdown format"""
+            system_prompt = DEFAULT_SYSTEM_PROMPT
         
         # If history is provided, include it in the context
         if history:
@@ -154,6 +276,24 @@ class BaseRAG:
         query_with_language_instruction = f"""Question: {user_query}
 
 Important: Respond in the same language as my question."""
+        
+        return context, query_with_language_instruction, system_prompt
+    
+    def query(self, user_query: str, system_prompt: Optional[str] = None, history: str = "", 
+              chat_history: List[Tuple[str, str]] = None, no_cache: bool = False) -> str:
+        """Process a user query using RAG."""
+        cache_key = self._response_cache_key(user_query, system_prompt, history, chat_history, no_cache)
+        if cache_key is not None:
+            cached_response = self.response_cache.get(*cache_key)
+            if cached_response is not None:
+                print("Serving response from the semantic cache")
+                return cached_response
+        
+        similar_docs = self._retrieve_documents(user_query, chat_history, cache_key[0] if cache_key else None)
+        
+        context, query_with_language_instruction, system_prompt = self._prepare_generation(
+            user_query, similar_docs, system_prompt, history
+        )
             
         # Generate the response
         print("\n----- LLM RESPONSE GENERATION -----")
@@ -165,4 +305,117 @@ Important: Respond in the same language as my question."""
         print(f"Response: {response[:100] + '...' if len(response) > 100 else response}")
         print("-----------------------------------\n")
         
+        if cache_key is not None:
+            self.response_cache.put(cache_key[0], response, cache_key[1])
+        return response
+    
+    def _retrieve_documents(self, user_query: str, chat_history: List[Tuple[str, str]] = None,
+                            query_embedding: Optional[Any] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieve documents for a user query, preprocessing it first if enabled.
+        
+        query_embedding, the embedding of the normalized user query, is reused if the
+        search query turns out to be the user query.
+        """
+        search_query = user_query
+        
+        # Use query preprocessing if enabled, even for the first query with no history
+        if self.use_query_preprocessing and self.query_preprocessor:
+            search_query = self._preprocess_query(user_query, chat_history)
+        
+        # Get similar documents using the (potentially enriched) query
+        if self.selected_topics:
+            print(f"Querying selected topics: {', '.join(self.selected_topics)}")
+        if search_query.strip().lower() != user_query.strip().lower():
+            query_embedding = None
+        return self._retrieve(search_query, query_embedding)
+    
+    async def _aretrieve_documents(self, user_query: str, chat_history: List[Tuple[str, str]] = None,
+                                   query_embedding: Optional[Any] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieve documents for a user query without blocking the event loop.
+        
+        With speculative_retrieval, documents are retrieved for the raw query while it
+        is being rewritten. A second retrieval only happens if the rewrite changed the query.
+        """
+        if not (self.speculative_retrieval and self.use_query_preprocessing and self.query_preprocessor):
+            return await asyncio.to_thread(self._retrieve_documents, user_query, chat_history, query_embedding)
+        
+        if self.selected_topics:
+            print(f"Querying selected topics: {', '.join(self.selected_topics)}")
+        
+        rewrite_task = asyncio.create_task(
+            asyncio.to_thread(self._preprocess_query, user_query, chat_history)
+        )
+        speculative_docs = await asyncio.to_thread(self._retrieve, user_query, query_embedding)
+        search_query = await rewrite_task
+        
+        if search_query.strip().lower() == user_query.strip().lower():
+            return speculative_docs
+        return await asyncio.to_thread(self._retrieve, search_query)
+    
+    async def aquery(self, user_query: str, system_prompt: Optional[str] = None, history: str = "",
+                     chat_history: List[Tuple[str, str]] = None, no_cache: bool = False) -> str:
+        """Process a user query using RAG without blocking the event loop."""
+        cache_key = await asyncio.to_thread(
+            self._response_cache_key, user_query, system_prompt, history, chat_history, no_cache
+        )
+        if cache_key is not None:
+            cached_response = self.response_cache.get(*cache_key)
+            if cached_response is not None:
+                print("Serving response from the semantic cache")
+                return cached_response
+        
+        similar_docs = await self._aretrieve_documents(user_query, chat_history, cache_key[0] if cache_key else None)
+        
+        context, query_with_language_instruction, system_prompt = self._prepare_generation(
+            user_query, similar_docs, system_prompt, history
+        )
+        
+        # Generate the response
+        print("\n----- LLM RESPONSE GENERATION -----")
+        print(f"Context length: {len(context)} characters")
+        print(f"User query: {user_query}")
+        
+        response = await self.llm.agenerate_response(context, query_with_language_instruction, system_prompt)
+        
+        print(f"Response: {response[:100] + '...' if len(response) > 100 else response}")
+        print("-----------------------------------\n")
+        
+        if cache_key is not None:
+            self.response_cache.put(cache_key[0], response, cache_key[1])
         return response
+    
+    def query_stream(self, user_query: str, system_prompt: Optional[str] = None, history: str = "",
+                     chat_history: List[Tuple[str, str]] = None, no_cache: bool = False) -> Iterator[str]:
+        """Process a user query using RAG, yielding the response text as it is generated."""
+        cache_key = self._response_cache_key(user_query, system_prompt, history, chat_history, no_cache)
+        if cache_key is not None:
+            cached_response = self.response_cache.get(*cache_key)
+            if cached_response is not None:
+                print("Serving response from the semantic cache")
+                yield cached_response
+                return
+        
+        similar_docs = self._retrieve_documents(user_query, chat_history, cache_key[0] if cache_key else None)
+        
+        context, query_with_language_instruction, system_prompt = self._prepare_generation(
+            user_query, similar_docs, system_prompt, history
+        )
+        
+        # Generate the response
+        print("\n----- LLM RESPONSE GENERATION -----")
+        print(f"Context length: {len(context)} characters")
+        print(f"User query: {user_query}")
+        
+        response_parts = []
+        for text in self.llm.stream_response(context, query_with_language_instruction, system_prompt):
+            response_parts.append(text)
+            yield text
+        
+        response = "".join(response_parts)
+        print(f"Response: {response[:100] + '...' if len(response) > 100 else response}")
+        print("-----------------------------------\n")
+        
+        if cache_key is not None:
+            self.response_cache.put(cache_key[0], response, cache_key[1])
@@ -1,48 +1,117 @@
 import os
-from typing import Optional
+import json
+import logging
+from functools import cached_property
+from typing import Optional, Iterator, Dict, Any
 from dotenv import load_dotenv
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 import google.generativeai as genai
 import deepseek
+import requests
+from requests.adapters import HTTPAdapter
 from interfaces import ILLM
 
+# Read .env once at import instead of on every LLM construction
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Connection pool of the HTTP session shared by every DeepSeek client
+DEEPSEEK_POOL_CONNECTIONS = 4
+DEEPSEEK_POOL_MAXSIZE = 16
+
+# deepseek.DeepSeekAPI posts with module-level requests calls, which open a new
+# connection every time; requests made through this session reuse them instead
+_deepseek_session = requests.Session()
+_deepseek_session.mount("https://", HTTPAdapter(pool_connections=DEEPSEEK_POOL_CONNECTIONS,
+                                                pool_maxsize=DEEPSEEK_POOL_MAXSIZE))
+
+class _SessionDeepSeekAPI(deepseek.DeepSeekAPI):
+    """DeepSeekAPI sending its completion requests through the shared requests session."""
+    
+    def _post_request(self, api_url, payload, stream):
+        # Same request and error handling as deepseek 1.0.0, but on the pooled session
+        response = _deepseek_session.post(api_url, headers=self.headers, data=json.dumps(payload), stream=stream)
+        if response.status_code >= 300:
+            raise Exception(f"HTTP Error {response.status_code}: {response.text}")
+        return response
+    
+    def completion_impl(self, response, type_='chat'):
+        # The stream stops reading at [DONE]; closing the response hands its connection back to the pool
+        try:
+            yield from super().completion_impl(response, type_)
+        finally:
+            response.close()
+
 class AnthropicLLM(ILLM):
     def __init__(self,
                  model: str = "claude-3-5-sonnet-20241022",
                  max_tokens: int = 1024,
                  temperature: float = 0.7):
-        load_dotenv()
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY not found in environment variables")
             
-        self.client = Anthropic(api_key=api_key)
+        self._api_key = api_key
         self.model = model
         self.max_tokens = max_tokens
         self.temperature = temperature
     
+    @cached_property
+    def client(self) -> Anthropic:
+        """Anthropic client, created on first use."""
+        return Anthropic(api_key=self._api_key)
+    
+    @cached_property
+    def async_client(self) -> AsyncAnthropic:
+        """Async Anthropic client, created on first use."""
+        return AsyncAnthropic(api_key=self._api_key)
+    
+    def _request_params(self, context: str, query: str, system_prompt: Optional[str]) -> Dict[str, Any]:
+        """
+        Build the Messages API parameters shared by every call path.
+        
+        No block is marked with cache_control: the system prompt is far below the
+        1024-token caching minimum, and the context (history plus retrieved documents)
+        changes every turn, so caching would only add the cache-write premium.
+        """
+        # Lazy %-formatting: the prompt is only rendered when debug logging is enabled
+        logger.debug("Context:\n%s\n\nQuestion: %s", context, query)
+        content = []
+        if context:
+            content.append({"type": "text", "text": f"Context:\n{context}"})
+        content.append({"type": "text", "text": f"Question: {query}"})
+        
+        params = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": content}],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature
+        }
+        if system_prompt:
+            params["system"] = system_prompt
+        return params
+    
     def generate_response(self, context: str, query: str, system_prompt: Optional[str] = None) -> str:
-        message = f"""Context:
-        {context}
+        response = self.client.messages.create(**self._request_params(context, query, system_prompt))
         
-        Question: {query}"""
-        print(message)
-        response = self.client.messages.create(
-            model=self.model,
-            messages=[{"role": "user", "content": message}],
-            system=system_prompt,
-            max_tokens=self.max_tokens,
-            temperature=self.temperature
-        )
+        return response.content[0].text
+    
+    async def agenerate_response(self, context: str, query: str, system_prompt: Optional[str] = None) -> str:
+        response = await self.async_client.messages.create(**self._request_params(context, query, system_prompt))
         
         return response.content[0].text
+    
+    def stream_response(self, context: str, query: str, system_prompt: Optional[str] = None) -> Iterator[str]:
+        with self.client.messages.stream(**self._request_params(context, query, system_prompt)) as stream:
+            for text in stream.text_stream:
+                yield text
 
 class GeminiLLM(ILLM):
     def __init__(self,
                  model: str = "gemini-2.0-flash",
                  max_tokens: int = 1024,
                  temperature: float = 0.7):
-        load_dotenv()
         api_key = os.getenv("GOOGLE_API_KEY")
         if not api_key:
             raise ValueError("GOOGLE_API_KEY not found in environment variables")
@@ -52,18 +121,21 @@ class GeminiLLM(ILLM):
         self.max_tokens = max_tokens
         self.temperature = temperature
     
-    def generate_response(self, context: str, query: str, system_prompt: Optional[str] = None) -> str:
-        combined_prompt = f"{system_prompt}\n\nContext:\n{context}\n\nQuestion: {query}"
-        
-        model = genai.GenerativeModel(
+    @cached_property
+    def generative_model(self) -> genai.GenerativeModel:
+        """Gemini model with this LLM's generation config, created on first use."""
+        return genai.GenerativeModel(
             model_name=self.model,
             generation_config=genai.GenerationConfig(
                 temperature=self.temperature,
                 max_output_tokens=self.max_tokens,
             )
         )
+    
+    def generate_response(self, context: str, query: str, system_prompt: Optional[str] = None) -> str:
+        combined_prompt = f"{system_prompt}\n\nContext:\n{context}\n\nQuestion: {query}"
         
-        response = model.generate_content(combined_prompt)
+        response = self.generative_model.generate_content(combined_prompt)
         return response.text
 
 class DeepseekLLM(ILLM):
@@ -71,7 +143,6 @@ class DeepseekLLM(ILLM):
                  model: str = "deepseek-chat-67b",
                  max_tokens: int = 1024,
                  temperature: float = 0.7):
-        load_dotenv()
         api_key = os.getenv("DEEPSEEK_API_KEY")
         if not api_key:
             raise ValueError("DEEPSEEK_API_KEY not found in environment variables")
@@ -81,18 +152,36 @@ class DeepseekLLM(ILLM):
         self.max_tokens = max_tokens
         self.temperature = temperature
     
-    def generate_response(self, context: str, query: str, system_prompt: Optional[str] = None) -> str:
-        message = f"""Context:
+    @cached_property
+    def client(self) -> deepseek.DeepSeekAPI:
+        """DeepSeek client, created on first use; its requests reuse the shared session's connections."""
+        return _SessionDeepSeekAPI(api_key=self.api_key)
+    
+    def _message(self, context: str, query: str) -> str:
+        """Build the user message sent to DeepSeek."""
+        return f"""Context:
         {context}
         
         Question: {query}"""
-        
-        deepseekAPI = deepseek.DeepSeekAPI(api_key=self.api_key)
-        response = deepseekAPI.chat_completion(
-            prompt=message,
+    
+    def generate_response(self, context: str, query: str, system_prompt: Optional[str] = None) -> str:
+        response = self.client.chat_completion(
+            prompt=self._message(context, query),
             prompt_sys=system_prompt,
             model=self.model,
             stream=False
         )
         
-        return response.choices[0].message.content
+        # The deepseek client returns the completion text itself, not a response object
+        return response
+    
+    def stream_response(self, context: str, query: str, system_prompt: Optional[str] = None) -> Iterator[str]:
+        response = self.client.chat_completion(
+            prompt=self._message(context, query),
+            prompt_sys=system_prompt,
+            model=self.model,
+            stream=True
+        )
+        
+        # The streamed response yields plain text deltas; skip the empty keep-alive ones
+        yield from (text for text in response if text)
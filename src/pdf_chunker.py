@@ -1,39 +1,129 @@
 import re
-import hashlib
-from typing import List
+import io
+import os
+import mmap
+from contextlib import contextmanager
+from typing import List, Iterator, Iterable, Optional, Tuple
 from pypdf import PdfReader
-from interfaces import IChunker, ChunkMetadata, TextChunk
+from interfaces import IChunker, ChunkMetadata, TextChunk, hash_text
+
+try:
+    # PyMuPDF extracts text in C; pypdf is used when it isn't installed
+    import fitz
+except ImportError:
+    fitz = None
+
+# PDFs larger than this are memory-mapped instead of read into memory
+MMAP_MIN_BYTES = 16 * 1024 * 1024
 
 class PdfChunker(IChunker):
     def __init__(self):
         pass
 
-    def _create_text_hash(self, text: str) -> str:
-        """Create a hash for the text content."""
-        return hashlib.sha256(text.encode()).hexdigest()[:16]
-
-    def chunk_document(self, file_path: str) -> List[TextChunk]:
+    def chunk_document(self, file_path: str, page_range: Optional[Tuple[int, int]] = None) -> List[TextChunk]:
         """
         Parse PDF and return chunks with metadata.
         
         Args:
             pdf_path: Path to the PDF file
+            page_range: Optional (start, stop) zero-based page indices; only these pages are parsed
             
         Returns:
             List of TextChunk objects containing the text and metadata
         """
-        chunks = []
-        reader = PdfReader(file_path)
+        return list(self.iter_chunks(file_path, page_range))
+    
+    def page_count(self, file_path: str) -> int:
+        """Number of pages in a PDF, read without extracting any text."""
+        doc = self._open_fitz(file_path)
+        if doc is not None:
+            with doc:
+                return doc.page_count
+        with self._open_reader(file_path) as reader:
+            return len(reader.pages)
+    
+    def iter_chunks(self, file_path: str, page_range: Optional[Tuple[int, int]] = None) -> Iterator[TextChunk]:
+        """
+        Lazily parse a PDF, yielding each page's chunk as soon as its text is extracted.
+        
+        Args:
+            file_path: Path to the PDF file
+            page_range: Optional (start, stop) zero-based page indices; only these pages are parsed
+            
+        Yields:
+            TextChunk objects containing the text and metadata
+        """
         file_name = file_path.split('/')[-1]
+        start, stop = page_range or (0, None)
+        
+        doc = self._open_fitz(file_path)
+        if doc is not None:
+            with doc:
+                pages = doc.pages(start, stop)
+                yield from self._iter_pages((page.get_text("text") for page in pages), file_name, start + 1)
+            return
         
-        for page_num, page in enumerate(reader.pages, 1):
-            text = page.extract_text()
+        # The reader stays open until the generator is exhausted or closed
+        with self._open_reader(file_path) as reader:
+            yield from self._iter_reader(reader, file_name, start, stop)
+    
+    def chunk_bytes(self, data: bytes, file_name: str) -> List[TextChunk]:
+        """
+        Parse an in-memory PDF and return chunks with metadata.
+        
+        Args:
+            data: Raw PDF bytes
+            file_name: Name of the file the bytes came from
+            
+        Returns:
+            List of TextChunk objects containing the text and metadata
+        """
+        doc = self._open_fitz(stream=data, filetype="pdf")
+        if doc is not None:
+            with doc:
+                return list(self._iter_pages((page.get_text("text") for page in doc), file_name))
+        
+        return list(self._iter_reader(PdfReader(io.BytesIO(data)), file_name))
+    
+    def _open_fitz(self, *args, **kwargs):
+        """Open a PDF with PyMuPDF, or return None to fall back to pypdf."""
+        if fitz is None:
+            return None
+        try:
+            doc = fitz.open(*args, **kwargs)
+        except fitz.FileDataError:
+            # Malformed for PyMuPDF; pypdf may still be able to read it
+            return None
+        if doc.needs_pass:
+            doc.close()
+            return None
+        return doc
+    
+    @contextmanager
+    def _open_reader(self, file_path: str) -> Iterator[PdfReader]:
+        """Open a PDF with pypdf, memory-mapping files larger than MMAP_MIN_BYTES."""
+        if os.path.getsize(file_path) > MMAP_MIN_BYTES:
+            # Let the OS page large PDFs in on demand; pypdf would otherwise copy the whole file
+            with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield PdfReader(mm)
+        else:
+            yield PdfReader(file_path)
+    
+    def _iter_reader(self, reader: PdfReader, file_name: str,
+                     start: int = 0, stop: Optional[int] = None) -> Iterator[TextChunk]:
+        """Yield one chunk per non-empty page of a PDF opened with pypdf, limited to pages start:stop."""
+        pages = reader.pages[start:stop]
+        return self._iter_pages((page.extract_text() for page in pages), file_name, start + 1)
+    
+    def _iter_pages(self, page_texts: Iterable[str], file_name: str, first_page: int = 1) -> Iterator[TextChunk]:
+        """Yield one chunk per non-empty page, given the extracted text of consecutive pages from first_page on."""
+        for page_num, text in enumerate(page_texts, first_page):
             if not text.strip():
                 continue
             
                     
             # Create hash for the paragraph
-            text_hash = self._create_text_hash(text)
+            text_hash = hash_text(text)
                 
             # Create metadata
             metadata = ChunkMetadata(
@@ -42,9 +132,6 @@ class PdfChunker(IChunker):
                 text_hash=text_hash,
             )
                 
-            # Create and append the chunk
+            # Create and yield the chunk
             text += "Source: " + file_name + "\nPage: " + str(page_num) + "\n\n"
-            chunk = TextChunk(text=text, metadata=metadata)
-            chunks.append(chunk)
-        
-        return chunks
+            yield TextChunk(text=text, metadata=metadata)
@@ -1,6 +1,32 @@
 from typing import List, Tuple, Optional
 from interfaces import ILLM
 
+# System prompt for enriching a query with the conversation history, unless the caller provides one
+ENRICH_SYSTEM_PROMPT = """You are a multilingual query assistant. Your task is to:
+            
+            1. Translate the user's query to English if it's in another language
+            2. Analyze the conversation history and the translated query
+            3. Produce an enriched search query IN ENGLISH that will help retrieve 
+               relevant information from a vector database
+            
+            The enriched query should:
+            1. Capture the core intent of the user's latest query
+            2. Include relevant context from previous conversation
+            3. Add relevant keywords that might help with document retrieval
+            4. Maintain clarity and focus on the main question
+            5. Resolve any references to previous messages (like "it", "that", etc.)
+            
+            Return ONLY the enriched English query text, with no additional explanations."""
+
+# System prompt for translating a query when there is no conversation history
+TRANSLATE_SYSTEM_PROMPT = """You are a multilingual translator. Your task is to:
+        
+        1. Translate the user's query to English if it's not already in English
+        2. Keep the query meaning intact
+        3. Make minimal changes if the query is already in English
+        
+        Return ONLY the translated English query, with no additional explanations."""
+
 class QueryPreprocessor:
     """
     Preprocesses user queries by using an LLM to:
@@ -39,21 +65,7 @@ class QueryPreprocessor:
         
         # Create the prompt for the LLM
         if not system_prompt:
-            system_prompt = """You are a multilingual query assistant. Your task is to:
-            
-            1. Translate the user's query to English if it's in another language
-            2. Analyze the conversation history and the translated query
-            3. Produce an enriched search query IN ENGLISH that will help retrieve 
-               relevant information from a vector database
-            
-            The enriched query should:
-            1. Capture the core intent of the user's latest query
-            2. Include relevant context from previous conversation
-            3. Add relevant keywords that might help with document retrieval
-            4. Maintain clarity and focus on the main question
-            5. Resolve any references to previous messages (like "it", "that", etc.)
-            
-            Return ONLY the enriched English query text, with no additional explanations."""
+            system_prompt = ENRICH_SYSTEM_PROMPT
         
         prompt = f"""Conversation History:
 {history_text}
@@ -77,13 +89,7 @@ Translate the query to English if needed, and rewrite it to create a more compre
         Returns:
             The translated query in English
         """
-        system_prompt = """You are a multilingual translator. Your task is to:
-        
-        1. Translate the user's query to English if it's not already in English
-        2. Keep the query meaning intact
-        3. Make minimal changes if the query is already in English
-        
-        Return ONLY the translated English query, with no additional explanations."""
+        system_prompt = TRANSLATE_SYSTEM_PROMPT
         
         prompt = f"Translate this query to English if needed: \"{query}\""
         
@@ -9,8 +9,11 @@ class RAG(BaseRAG):
                  llm: ILLM,
                  embedding_manager: Optional[IEmbeddingManager] = None,
                  context_limit: int = 5,
-                 use_query_preprocessing: bool = False):
+                 use_query_preprocessing: bool = False,
+                 use_response_cache: bool = False,
+                 speculative_retrieval: bool = False):
         if embedding_manager is None:
             embedding_manager = ChromaManager()
             
-        super().__init__(llm, embedding_manager, context_limit, use_query_preprocessing)
+        super().__init__(llm, embedding_manager, context_limit, use_query_preprocessing, use_response_cache,
+                         speculative_retrieval)
@@ -35,6 +35,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Number of ids fetched per call when listing a collection
+ID_PAGE_SIZE = 10_000
+
 
 class RAGQualityEvaluator:
     """
@@ -102,12 +105,16 @@ class RAGQualityEvaluator:
             logger.error("No documents found in the collection.")
             return []
         
-        # Get all documents from the collection
-        # Note: This is a simple approach - for very large collections,
-        # you might want to implement more efficient sampling
+        # Get all document IDs from the collection, one page at a time.
+        # include=[] makes Chroma return only ids, not documents or embeddings.
         try:
             collection = self.embedding_manager.create_collection(self.collection_name)
-            all_ids = collection.get()["ids"]
+            all_ids = []
+            while True:
+                page_ids = collection.get(limit=ID_PAGE_SIZE, offset=len(all_ids), include=[])["ids"]
+                all_ids.extend(page_ids)
+                if len(page_ids) < ID_PAGE_SIZE:
+                    break
             
             # Randomly select document IDs
             if len(all_ids) <= self.num_samples:
@@ -116,16 +123,18 @@ class RAGQualityEvaluator:
             else:
                 selected_ids = random.sample(all_ids, self.num_samples)
             
-            # Get the selected documents
-            selected_docs = []
-            for doc_id in selected_ids:
-                result = collection.get(ids=[doc_id])
-                
-                selected_docs.append({
+            # Get the selected documents in a single call
+            result = collection.get(ids=selected_ids, include=["documents", "metadatas"])
+            selected_docs = [
+                {
                     'id': doc_id,
-                    'document': result["documents"][0],
-                    'metadata': result["metadatas"][0] if result["metadatas"] else {}
-                })
+                    'document': document,
+                    'metadata': metadata or {}
+                }
+                for doc_id, document, metadata in zip(
+                    result["ids"], result["documents"], result["metadatas"] or [None] * len(result["ids"])
+                )
+            ]
             
             logger.info(f"Successfully selected {len(selected_docs)} documents")
             return selected_docs
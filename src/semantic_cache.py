@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import numpy as np
+
+class SemanticCache:
+    """
+    Cache of LLM responses looked up by the similarity of query embeddings.
+
+    A lookup returns the response of the most similar cached query if its cosine
+    similarity is at least tau. Entries expire ttl seconds after they were stored,
+    and the least recently used entry is evicted once max_entries is reached.
+    Entries are grouped by a namespace so that, e.g., answers produced for one set
+    of topics are never served for another.
+    """
+
+    def __init__(self, tau: float = 0.9, ttl: float = 600, max_entries: int = 1024):
+        self.tau = tau
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> (timestamp, namespace, normalized embedding, response)
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: Any) -> np.ndarray:
+        """L2-normalize an embedding so an inner product gives the cosine similarity."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding: Any, namespace: Hashable = None) -> Optional[Any]:
+        """
+        Look up the response cached for the most similar query.
+
+        Args:
+            embedding (Any): Embedding of the query
+            namespace (Hashable): Only entries stored under this namespace are considered
+
+        Returns:
+            Optional[Any]: The cached response, or None on a miss
+        """
+        query = self._normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if now - entry[0] >= self.ttl]
+            for key in expired:
+                del self._entries[key]
+
+            keys = [key for key, entry in self._entries.items() if entry[1] == namespace]
+            if not keys:
+                return None
+
+            # Flat inner-product scan over the normalized embeddings
+            scores = np.stack([self._entries[key][2] for key in keys]) @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.tau:
+                return None
+
+            self._entries.move_to_end(keys[best])
+            return self._entries[keys[best]][3]
+
+    def put(self, embedding: Any, response: Any, namespace: Hashable = None) -> None:
+        """
+        Store the response for a query.
+
+        Args:
+            embedding (Any): Embedding of the query
+            response (Any): Response to return for similar queries
+            namespace (Hashable): Namespace to store the entry under
+        """
+        vector = self._normalize(embedding)
+
+        with self._lock:
+            self._entries[self._next_key] = (time.monotonic(), namespace, vector, response)
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove every cached response."""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,33 @@
+from chat_history import ChatHistory, estimate_tokens
+
+def test_zero_depth_keeps_no_history():
+    history = ChatHistory(0)
+    history.add("question", "answer")
+    history.add("another question", "another answer")
+    
+    assert history.pairs() == []
+    assert history.tokens == 0
+
+def test_full_history_drops_oldest_interaction_and_its_tokens():
+    history = ChatHistory(2)
+    history.add("first", "a")
+    history.add("second", "b")
+    history.add("third", "c")
+    
+    assert history.pairs() == [("second", "b"), ("third", "c")]
+    assert history.tokens == sum(estimate_tokens(text) for text in ("second", "b", "third", "c"))
+
+def test_trim_keeps_history_within_budget():
+    history = ChatHistory(3)
+    history.add("q" * 400, "a" * 400)
+    history.add("short", "reply")
+    
+    history.trim(10)
+    
+    assert history.pairs() == [("short", "reply")]
+
+if __name__ == "__main__":
+    test_zero_depth_keeps_no_history()
+    test_full_history_drops_oldest_interaction_and_its_tokens()
+    test_trim_keeps_history_within_budget()
+    print("Chat history OK")
@@ -0,0 +1,46 @@
+import tempfile
+from chromadb import Documents, EmbeddingFunction, Embeddings
+from chroma_manager import ChromaManager
+
+class FakeEmbeddingFunction(EmbeddingFunction):
+    """Deterministic embeddings, so the test doesn't need the ONNX model."""
+    
+    def __init__(self):
+        pass
+    
+    def __call__(self, input: Documents) -> Embeddings:
+        return [[float(len(text)), 1.0, 0.0] for text in input]
+
+def test_duplicate_ids_in_one_buffer_are_coalesced():
+    with tempfile.TemporaryDirectory() as persist_directory:
+        manager = ChromaManager(persist_directory=persist_directory, embedding_function=FakeEmbeddingFunction())
+        manager.add_document("first version", doc_id="doc")
+        manager.add_document("other document", doc_id="other")
+        manager.add_document("second version", doc_id="doc")
+        
+        manager.flush_pending()
+        
+        assert manager.collection.get(ids=["doc"])["documents"] == ["second version"]
+        assert manager.get_collection_stats() == {"total_documents": 2}
+
+def test_failed_flush_does_not_poison_later_reads():
+    with tempfile.TemporaryDirectory() as persist_directory:
+        manager = ChromaManager(persist_directory=persist_directory, embedding_function=FakeEmbeddingFunction())
+        # An embedding of the wrong dimension is only rejected when the buffer is written
+        manager.add_document("good", doc_id="good", embedding=[1.0, 1.0, 0.0])
+        manager.flush_pending()
+        manager.add_document("bad", doc_id="bad", embedding=[1.0, 1.0])
+        
+        try:
+            manager.flush_pending()
+        except Exception:
+            pass
+        else:
+            raise AssertionError("the invalid batch should have raised once")
+        
+        assert manager.get_collection_stats() == {"total_documents": 1}
+
+if __name__ == "__main__":
+    test_duplicate_ids_in_one_buffer_are_coalesced()
+    test_failed_flush_does_not_poison_later_reads()
+    print("ChromaManager add buffer OK")
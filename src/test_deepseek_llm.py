@@ -0,0 +1,27 @@
+import os
+from llm_implementations import DeepseekLLM
+
+class FakeDeepSeekClient:
+    """Stands in for deepseek.DeepSeekAPI, which returns plain strings."""
+    
+    def chat_completion(self, prompt, prompt_sys=None, model=None, stream=False, **kwargs):
+        if stream:
+            return iter(["The ", "", "answer", ""])
+        return "The answer"
+
+def make_llm() -> DeepseekLLM:
+    os.environ.setdefault("DEEPSEEK_API_KEY", "test-key")
+    llm = DeepseekLLM()
+    llm.client = FakeDeepSeekClient()
+    return llm
+
+def test_generate_response_returns_text():
+    assert make_llm().generate_response("context", "question") == "The answer"
+
+def test_stream_response_yields_text_deltas():
+    assert list(make_llm().stream_response("context", "question")) == ["The ", "answer"]
+
+if __name__ == "__main__":
+    test_generate_response_returns_text()
+    test_stream_response_yields_text_deltas()
+    print("DeepSeek response handling OK")
@@ -1,6 +1,5 @@
-import hashlib
-from typing import List
-from interfaces import IChunker, ChunkMetadata, TextChunk
+from typing import List, Iterator, Iterable, Union
+from interfaces import IChunker, ChunkMetadata, TextChunk, hash_text
 import os
 
 class TextChunker(IChunker):
@@ -9,10 +8,6 @@ class TextChunker(IChunker):
     def __init__(self, chunk_size: int = 1000):
         self.chunk_size = chunk_size
     
-    def _create_text_hash(self, text: str) -> str:
-        """Create a hash for the text content."""
-        return hashlib.sha256(text.encode()).hexdigest()[:16]
-    
     def chunk_document(self, file_path: str) -> List[TextChunk]:
         """
         Read and chunk a text file.
@@ -23,29 +18,71 @@ class TextChunker(IChunker):
         Returns:
             List of TextChunk objects containing the text and metadata
         """
-        # Read the file
-        with open(file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
+        return list(self.iter_document_chunks(file_path))
+    
+    def iter_document_chunks(self, file_path: str) -> Iterator[TextChunk]:
+        """
+        Lazily chunk a text file, reading only one chunk's worth of characters at a time.
+        
+        Args:
+            file_path: Path to the text file
             
-        if not text.strip():
-            return []
+        Yields:
+            TextChunk objects containing the text and metadata
+        """
+        with open(file_path, 'r', encoding='utf-8') as f:
+            yield from self._iter_pieces(iter(lambda: f.read(self.chunk_size), ''), os.path.basename(file_path))
+    
+    def chunk_bytes(self, data: bytes, file_name: str) -> List[TextChunk]:
+        """
+        Decode and chunk an in-memory text file.
+        
+        Args:
+            data: Raw UTF-8 encoded file content
+            file_name: Name of the file the bytes came from
             
-        # Get file name
-        file_name = os.path.basename(file_path)
+        Returns:
+            List of TextChunk objects containing the text and metadata
+        """
+        return self.chunk_text(data.decode('utf-8'), file_name)
+    
+    def chunk_text(self, text: str, file_name: str, stream: bool = False) -> Union[List[TextChunk], Iterator[TextChunk]]:
+        """
+        Split text into fixed-size chunks.
         
-        # Create chunks
-        chunks = []
-        start = 0
-        chunk_number = 1
+        Args:
+            text: The text to chunk
+            file_name: Name of the file the text came from
+            stream: If True, return a lazy iterator instead of a list
+            
+        Returns:
+            List (or iterator, if stream is True) of TextChunk objects containing the text and metadata
+        """
+        chunks = self.iter_chunks(text, file_name)
+        return chunks if stream else list(chunks)
+    
+    def iter_chunks(self, text: str, file_name: str) -> Iterator[TextChunk]:
+        """
+        Lazily split text into fixed-size chunks, yielding each one as it is cut.
         
-        while start < len(text):
-            # Get chunk text
-            chunk_text = text[start:start + self.chunk_size]
+        Args:
+            text: The text to chunk
+            file_name: Name of the file the text came from
+            
+        Yields:
+            TextChunk objects containing the text and metadata
+        """
+        pieces = (text[start:start + self.chunk_size] for start in range(0, len(text), self.chunk_size))
+        return self._iter_pieces(pieces, file_name)
+    
+    def _iter_pieces(self, pieces: Iterable[str], file_name: str) -> Iterator[TextChunk]:
+        """Turn consecutive chunk_size pieces of a text into chunks, stopping at the first blank piece."""
+        for chunk_number, chunk_text in enumerate(pieces, 1):
             if not chunk_text.strip():
                 break
                 
             # Create hash for the chunk
-            text_hash = self._create_text_hash(chunk_text)
+            text_hash = hash_text(chunk_text)
             
             # Create metadata
             metadata = ChunkMetadata(
@@ -54,12 +91,4 @@ class TextChunker(IChunker):
                 text_hash=text_hash
             )
             
-            # Create and append chunk
-            chunk = TextChunk(text=chunk_text, metadata=metadata)
-            chunks.append(chunk)
-            
-            # Move to next chunk
-            start += self.chunk_size
-            chunk_number += 1
-        
-        return chunks
+            yield TextChunk(text=chunk_text, metadata=metadata)